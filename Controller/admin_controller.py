@@ -41,7 +41,7 @@ class AdminController:
 
 
     def create_access_token(self, username: str, expires_delta: timedelta = timedelta(hours=4)):
-        payload = {"sub": username, "exp": datetime.utcnow() + expires_delta}
+        payload = {"sub": username, "role": "admin", "exp": datetime.utcnow() + expires_delta}
         return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
     async def login(self, email: str, password: str):
@@ -53,7 +53,7 @@ class AdminController:
             raise HTTPException(status_code=401, detail="Incorrect password")
 
         # إنشاء توكن JWT
-        payload = {"sub": email, "exp": datetime.utcnow() + timedelta(hours=4)}
+        payload = {"sub": email, "role": "admin", "exp": datetime.utcnow() + timedelta(hours=4)}
         token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
         return {"access_token": token, "token_type": "bearer"}
 
@@ -0,0 +1,101 @@
+import math
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+from Controller.inference_batcher import InferenceQueueFull
+from core.metrics import AI_ADMISSION_REJECTIONS, AI_INFLIGHT_REQUESTS
+
+
+# الرقم الأصغر بيطلع من الطابور أول؛ شغل الخلفية (shadow، الشرح المؤجل) آخر إشي
+ROLE_PRIORITIES = {"doctor": 0, "admin": 0, "patient": 1, "anonymous": 2}
+BACKGROUND_PRIORITY = 3
+
+
+def user_role(user):
+    return user["role"] if user and user.get("role") in ROLE_PRIORITIES else "anonymous"
+
+
+class AdmissionController:
+    """
+    قبل ما طلب AI يدخل الطابور:
+    - حد للطلبات المتزامنة لكل مستخدم (المجهولين ما إلهم هوية، فبيتحكم فيهم حد الطابور بس)
+    - كل دور إله حصة من الطابور؛ الدكتور بيقدر يستخدمه كامل، والمريض والمجهول جزء منه
+      فطلبات المرضى ما بتسكّر الطابور بوجه الدكاترة
+    - الانتظار المتوقع (من زمن الدفعات الأخيرة والطلبات اللي قبله بالأولوية) ما بيعدّي deadline_seconds
+    غير هيك بيترفض فوراً بـ 503 (أو 429 لحد المستخدم) مع Retry-After.
+    """
+
+    def __init__(self, batcher, per_user_limit=2, deadline_seconds=20.0, role_queue_shares=None):
+        self.batcher = batcher
+        self.per_user_limit = per_user_limit
+        self.deadline_seconds = deadline_seconds
+        self.role_queue_shares = role_queue_shares or {"doctor": 1.0, "admin": 1.0, "patient": 0.75, "anonymous": 0.5}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _reject(self, endpoint, role, reason, retry_after, status_code=503):
+        AI_ADMISSION_REJECTIONS.labels(endpoint, role, reason).inc()
+        detail = {
+            "user_limit": "عندك طلبات تحليل قيد التنفيذ، انتظر انتهاءها ثم حاول مرة أخرى",
+            "queue_full": "الخادم مشغول بطلبات تحليل أخرى، حاول مرة أخرى بعد قليل",
+            "deadline": "وقت الانتظار المتوقع طويل حالياً، حاول مرة أخرى بعد قليل"
+        }[reason]
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    def _retry_after(self, priority, items):
+        estimated = self.batcher.estimated_wait(priority, items)
+        return estimated if estimated is not None else 5
+
+    def _check_queue(self, endpoint, role, priority, items):
+        estimated = self.batcher.estimated_wait(priority, items)
+        retry_after = estimated if estimated is not None else 5
+
+        limit = int(self.batcher.max_queue * self.role_queue_shares.get(role, 0.5))
+        if self.batcher.queue_depth() + items > limit:
+            raise self._reject(endpoint, role, "queue_full", retry_after)
+        if estimated is not None and estimated > self.deadline_seconds:
+            raise self._reject(endpoint, role, "deadline", estimated - self.deadline_seconds)
+
+    @asynccontextmanager
+    async def admit(self, user, endpoint, items=1):
+        # بترجع أولوية الطلب اللي لازم تنبعت مع submit للطابور
+        role = user_role(user)
+        priority = ROLE_PRIORITIES[role]
+        key = user["id"] if user else None
+
+        with self._lock:
+            if key is not None and self._inflight.get(key, 0) >= self.per_user_limit:
+                raise self._reject(endpoint, role, "user_limit", 2, status_code=429)
+            self._check_queue(endpoint, role, priority, items)
+            if key is not None:
+                self._inflight[key] = self._inflight.get(key, 0) + 1
+
+        AI_INFLIGHT_REQUESTS.labels(role).inc()
+        try:
+            yield priority
+        except InferenceQueueFull:
+            # الطابور امتلى بين الفحص والـ submit، أو طابور سيرفر الـ inference المشترك مليان
+            raise self._reject(endpoint, role, "queue_full", self._retry_after(priority, items))
+        finally:
+            AI_INFLIGHT_REQUESTS.labels(role).dec()
+            if key is not None:
+                with self._lock:
+                    self._inflight[key] -= 1
+                    if not self._inflight[key]:
+                        del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "per_user_limit": self.per_user_limit,
+                "deadline_seconds": self.deadline_seconds,
+                "role_queue_shares": self.role_queue_shares,
+                "users_inflight": len(self._inflight),
+                "requests_inflight": sum(self._inflight.values())
+            }
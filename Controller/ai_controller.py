@@ -1,15 +1,19 @@
 import os
 import numpy as np
 import tensorflow as tf
-import cv2
 from tensorflow.keras.preprocessing import image as keras_image
 from tensorflow.keras.applications.efficientnet_v2 import preprocess_input as preprocess_efficientnet_v2
-import base64
+import time
+import weakref
+from core.ai_config import (
+    AI_BACKEND, AI_BATCH_BUCKETS, AI_JIT_COMPILE, AI_MAX_BATCH_SIZE, AI_THREAD_PROFILE, AI_TTA_SHIFT, TFLITE_MODEL_PATH
+)
+from Controller.image_ops import (
+    CLASS_NAMES, IMAGE_FORMATS, IMG_SIZE, array_to_base64, decode_image_bytes, decode_rgb, encode_image,
+    find_regions, get_bbox_from_heatmap, load_inputs, overlay_heatmap_and_box, preprocess_rgb, render_explanation
+)
 
 
-IMG_SIZE = 456
-CLASS_NAMES = ["benign", "malignant", "normal"]
-
 
 def load_original_rgb(img_path):
     img = keras_image.load_img(img_path, target_size=(IMG_SIZE, IMG_SIZE))
@@ -26,7 +30,31 @@ def load_preprocessed(img_path):
 
 
 
+_LAST_CONV_CACHE = weakref.WeakKeyDictionary()
+_EXPLAINERS = weakref.WeakKeyDictionary()
+
+
 def find_last_conv_layer(model):
+    # البحث بيمشي على كل طبقات الموديل، فبنحفظ النتيجة لكل موديل
+    if model in _LAST_CONV_CACHE:
+        return _LAST_CONV_CACHE[model]
+
+    name = _search_last_conv_layer(model)
+    _LAST_CONV_CACHE[model] = name
+    return name
+
+
+def find_embedding_layer(model):
+    # آخر طبقة global pooling (أو backbone متداخل مخرجه vector) قبل الـ classifier
+    for layer in reversed(model.layers):
+        if isinstance(layer, (tf.keras.layers.GlobalAveragePooling2D, tf.keras.layers.GlobalMaxPooling2D)):
+            return layer.name
+        if isinstance(layer, tf.keras.Model) and len(layer.output.shape) == 2:
+            return layer.name
+    return None
+
+
+def _search_last_conv_layer(model):
     for layer in reversed(model.layers):
         if isinstance(layer, (tf.keras.layers.Conv2D,
                               tf.keras.layers.DepthwiseConv2D)):
@@ -38,117 +66,413 @@ def find_last_conv_layer(model):
     return None
 
 
-def gradcam(model, x, class_index):
-    from tensorflow.keras.models import Model
-    import tensorflow as tf
-
-    if len(x.shape) == 3:
-        x = tf.expand_dims(x, axis=0)
-
-    last_conv_name = find_last_conv_layer(model)
-    last_conv_layer = model.get_layer(last_conv_name)
-
-    grad_model = Model(
-        inputs=model.inputs,
-        outputs=[last_conv_layer.output, model.output]
-    )
-
-    with tf.GradientTape() as tape:
-        conv_outputs, predictions = grad_model(
-            {"input_layer_1": x}
-        )
-
-        if isinstance(predictions, list):
-            predictions = predictions[0]
+class GradCamExplainer:
+    """
+    يبني grad_model مرة واحدة لكل موديل محمّل. كل خطوة (predict / fused / heatmaps)
+    عبارة عن tf.function مع XLA (jit_compile) و concrete function ثابتة لكل
+    bucket من AI_BATCH_BUCKETS بس: الدفعة بتتعبّى لأصغر bucket بيكفيها، فكل الأشكال
+    بتتسخّن عند التحميل وما في compile على thread الـ inference وقت الطلبات.
+    الدفعات الأكبر من أكبر bucket بتتقسم على أجزاء.
+    """
 
-        loss = predictions[0, class_index]
+    def __init__(self, model, buckets=None, jit_compile=None):
+        from tensorflow.keras.models import Model
 
-    grads = tape.gradient(loss, conv_outputs)
-    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
+        self.buckets = sorted(buckets or AI_BATCH_BUCKETS)
+        self.max_batch_size = self.buckets[-1]
+        self.jit_compile = AI_JIT_COMPILE if jit_compile is None else jit_compile
 
-    conv_outputs = conv_outputs[0]
-    heatmap = tf.reduce_sum(conv_outputs * pooled_grads, axis=-1)
+        # ما بنحتفظ بالموديل نفسه عشان الكاش (WeakKeyDictionary) يقدر يحرره
+        self.last_conv_name = find_last_conv_layer(model)
+        last_conv_layer = model.get_layer(self.last_conv_name)
 
-    heatmap = tf.maximum(heatmap, 0)
-    heatmap /= tf.reduce_max(heatmap) + 1e-8
+        # الـ embedding = مخرج طبقة الـ pooling قبل الـ classifier (1280 لـ EfficientNetV2-L)
+        self.embedding_name = find_embedding_layer(model)
+        outputs = [last_conv_layer.output, model.output]
+        if self.embedding_name is not None:
+            outputs.append(model.get_layer(self.embedding_name).output)
 
-    return heatmap.numpy(), last_conv_name
+        self.grad_model = Model(inputs=model.inputs, outputs=outputs)
 
+        self._functions = {
+            "predict": tf.function(self._compute_probs, jit_compile=self.jit_compile),
+            "heatmaps": tf.function(self._compute_heatmaps, jit_compile=self.jit_compile),
+            "fused": tf.function(self._compute_fused, jit_compile=self.jit_compile),
+        }
+        self._concrete = {}
 
+    def _forward(self, x):
+        # tensor مباشرة بدل dict عشان ما يصير retracing على شكل المدخلات
+        outputs = self.grad_model(x, training=False)
+        conv_outputs, predictions = outputs[0], outputs[1]
 
+        if isinstance(predictions, list):
+            predictions = predictions[0]
+        if self.embedding_name is not None:
+            embeddings = outputs[2]
+        else:
+            # موديل بدون طبقة pooling واضحة: متوسط آخر conv
+            embeddings = tf.reduce_mean(conv_outputs, axis=(1, 2))
+        return conv_outputs, predictions, embeddings
+
+    def _class_loss(self, predictions, class_indices):
+        # مجموع الـ losses آمن لأن كل صورة مستقلة عن الباقي في الـ inference
+        return tf.reduce_sum(
+            tf.gather(predictions, class_indices[:, None], batch_dims=1)
+        )
 
-def get_bbox_from_heatmap(heatmap, thresh=0.80, use_largest_cc=True):
-    mask = (heatmap >= thresh).astype(np.uint8)
-
-    if mask.sum() == 0:
+    def _heatmaps_from_grads(self, conv_outputs, grads):
+        pooled_grads = tf.reduce_mean(grads, axis=(1, 2))
+
+        heatmaps = tf.reduce_sum(conv_outputs * pooled_grads[:, None, None, :], axis=-1)
+
+        heatmaps = tf.maximum(heatmaps, 0)
+        heatmaps /= tf.reduce_max(heatmaps, axis=(1, 2), keepdims=True) + 1e-8
+        return heatmaps
+
+    # كل signature بترجع الـ embeddings كآخر مخرج (رخيصة لأنها من نفس الـ forward)
+    def _compute_probs(self, x):
+        _, predictions, embeddings = self._forward(x)
+        return predictions, embeddings
+
+    def _compute_heatmaps(self, x, class_indices):
+        with tf.GradientTape() as tape:
+            conv_outputs, predictions, embeddings = self._forward(x)
+            loss = self._class_loss(predictions, class_indices)
+
+        grads = tape.gradient(loss, conv_outputs)
+        return self._heatmaps_from_grads(conv_outputs, grads), embeddings
+
+    def _compute_fused(self, x):
+        # تمريرة forward وحدة: الاحتمالات + الـ activations + الـ gradients
+        with tf.GradientTape() as tape:
+            conv_outputs, predictions, embeddings = self._forward(x)
+            class_indices = tf.argmax(predictions, axis=1, output_type=tf.int32)
+            loss = self._class_loss(predictions, class_indices)
+
+        grads = tape.gradient(loss, conv_outputs)
+        return predictions, self._heatmaps_from_grads(conv_outputs, grads), embeddings
+
+    def _signature(self, name, batch_size):
+        key = (name, batch_size)
+        if key not in self._concrete:
+            specs = [tf.TensorSpec([batch_size, IMG_SIZE, IMG_SIZE, 3], tf.float32)]
+            if name == "heatmaps":
+                specs.append(tf.TensorSpec([batch_size], tf.int32))
+            self._concrete[key] = self._functions[name].get_concrete_function(*specs)
+        return self._concrete[key]
+
+    def _run(self, name, *arrays):
+        arrays = [np.asarray(a) for a in arrays]
+        n = arrays[0].shape[0]
+
+        chunks = []
+        for start in range(0, n, self.max_batch_size):
+            parts = [a[start:start + self.max_batch_size] for a in arrays]
+            count = len(parts[0])
+            size = bucket_size(count, self.buckets)
+            parts = [pad_batch(p, size) for p in parts]
+            tensors = [tf.convert_to_tensor(parts[0], dtype=tf.float32)]
+            tensors += [tf.convert_to_tensor(p, dtype=tf.int32) for p in parts[1:]]
+            outputs = self._signature(name, size)(*tensors)
+            chunks.append([o.numpy()[:count] for o in outputs])
+
+        if len(chunks) == 1:
+            return chunks[0]
+        return [np.concatenate(parts, axis=0) for parts in zip(*chunks)]
+
+    # with_embeddings=True بتضيف الـ embeddings كآخر عنصر بالنتيجة
+    def __call__(self, x, class_indices, with_embeddings=False):
+        heatmaps, embeddings = self._run("heatmaps", x, class_indices)
+        return (heatmaps, embeddings) if with_embeddings else heatmaps
+
+    def predict(self, x, with_embeddings=False):
+        probs, embeddings = self._run("predict", x)
+        return (probs, embeddings) if with_embeddings else probs
+
+    def predict_and_explain(self, x, with_embeddings=False):
+        # ترجع (probs, heatmaps) لنفس الدفعة
+        probs, heatmaps, embeddings = self._run("fused", x)
+        return (probs, heatmaps, embeddings) if with_embeddings else (probs, heatmaps)
+
+
+def bucket_size(n, buckets=AI_BATCH_BUCKETS):
+    # أصغر bucket بيكفي n صورة (n ما بيعدّي أكبر bucket)
+    return next(size for size in buckets if size >= n)
+
+
+def pad_batch(array, size):
+    # صفوف أصفار لآخر الدفعة؛ كل صورة مستقلة فالتعبئة ما بتأثر على نتائج الصور الحقيقية
+    if array.shape[0] == size:
+        return array
+    padding = np.zeros((size - array.shape[0],) + array.shape[1:], dtype=array.dtype)
+    return np.concatenate([array, padding], axis=0)
+
+
+class TFLiteClassifier:
+    """
+    تشغيل الموديل المكمّم (dynamic-range أو int8) عبر TFLite interpreter.
+    الـ XNNPACK delegate بيتفعّل تلقائياً على الـ CPU.
+    الـ interpreter مش thread-safe، فلازم يضل على thread الـ inference فقط.
+    بيُستخدم بس للتنبؤ بدون شرح؛ مع الشرح التمريرة كلها على Keras (predict_and_explain_batch).
+    """
+
+    def __init__(self, model_path, num_threads=None, buckets=AI_BATCH_BUCKETS):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            Interpreter = tf.lite.Interpreter
+
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.buckets = buckets
+        self._interpreter_class = Interpreter
+        # interpreter لكل bucket، بيتخصص مرة وحدة؛ تغيّر حجم الدفعة ما بيعمل allocate_tensors من جديد
+        self._interpreters = {}
+
+    def _interpreter(self, batch_size):
+        entry = self._interpreters.get(batch_size)
+        if entry is None:
+            interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.num_threads)
+            input_index = interpreter.get_input_details()[0]["index"]
+            interpreter.resize_tensor_input(input_index, [batch_size, IMG_SIZE, IMG_SIZE, 3])
+            interpreter.allocate_tensors()
+            entry = (interpreter, interpreter.get_input_details()[0], interpreter.get_output_details()[0])
+            self._interpreters[batch_size] = entry
+        return entry
+
+    def _quantize(self, x, details):
+        scale, zero_point = details["quantization"]
+        if details["dtype"] == np.float32 or not scale:
+            return x.astype(details["dtype"])
+        info = np.iinfo(details["dtype"])
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(details["dtype"])
+
+    def _dequantize(self, y, details):
+        scale, zero_point = details["quantization"]
+        if details["dtype"] == np.float32 or not scale:
+            return y.astype(np.float32)
+        return (y.astype(np.float32) - zero_point) * scale
+
+    def predict(self, x):
+        x = np.asarray(x)
+        outputs = []
+        for start in range(0, x.shape[0], self.buckets[-1]):
+            part = x[start:start + self.buckets[-1]]
+            size = bucket_size(part.shape[0], self.buckets)
+            interpreter, input_details, output_details = self._interpreter(size)
+            interpreter.set_tensor(input_details["index"], self._quantize(pad_batch(part, size), input_details))
+            interpreter.invoke()
+            y = self._dequantize(interpreter.get_tensor(output_details["index"]), output_details)
+            outputs.append(y[:part.shape[0]])
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs, axis=0)
+
+
+def load_classifier(backend=None, tflite_path=None, num_threads=None):
+    # None = نستخدم الـ Keras model نفسه للتنبؤ
+    backend = backend or AI_BACKEND
+    if backend == "keras":
         return None
-
-    if use_largest_cc:
-        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
-        if num_labels <= 1:
-            return None
-
-        largest = 1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])
-        mask = (labels == largest).astype(np.uint8)
-
-        if mask.sum() == 0:
-            return None
-
-    ys, xs = np.where(mask == 1)
-    y1, y2 = int(ys.min()), int(ys.max())
-    x1, x2 = int(xs.min()), int(xs.max())
-    return x1, y1, x2, y2
-
-
-def overlay_heatmap_and_box(img, heatmap, alpha=0.35, thresh=0.80):
-    heatmap = cv2.resize(heatmap, (img.shape[1], img.shape[0]))
-    heatmap_uint8 = np.uint8(255 * heatmap)
-
-    heatmap_color = cv2.applyColorMap(heatmap_uint8, cv2.COLORMAP_JET)
-    heatmap_color = cv2.cvtColor(heatmap_color, cv2.COLOR_BGR2RGB)
-
-    overlay = cv2.addWeighted(img, 1 - alpha, heatmap_color, alpha, 0)
-
-    bbox = get_bbox_from_heatmap(heatmap, thresh=thresh, use_largest_cc=True)
-    if bbox:
-        x1, y1, x2, y2 = bbox
-        cv2.rectangle(overlay, (x1, y1), (x2, y2), (0, 255, 0), 4)
-
-    return heatmap_color, overlay
+    if backend == "tflite":
+        return TFLiteClassifier(tflite_path or TFLITE_MODEL_PATH, num_threads=num_threads)
+    raise ValueError(f"Unknown AI backend: {backend}")
+
+
+def apply_thread_profile(profile=None):
+    """
+    intra/inter-op threads من بروفايل scripts/autotune_threads.py (أو AI_INTRA_OP_THREADS /
+    AI_INTER_OP_THREADS). TensorFlow بيقبلهم بس قبل أول عملية، فبعدها بنرجع الخطأ بدل ما نوقف التحميل.
+    """
+    profile = AI_THREAD_PROFILE if profile is None else profile
+    intra = int(os.getenv("AI_INTRA_OP_THREADS", profile.get("intra_op_threads", 0)))
+    inter = int(os.getenv("AI_INTER_OP_THREADS", profile.get("inter_op_threads", 0)))
+
+    applied = {"onednn": os.getenv("TF_ENABLE_ONEDNN_OPTS")}
+    try:
+        if intra and tf.config.threading.get_intra_op_parallelism_threads() != intra:
+            tf.config.threading.set_intra_op_parallelism_threads(intra)
+        if inter and tf.config.threading.get_inter_op_parallelism_threads() != inter:
+            tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except RuntimeError as e:
+        applied["error"] = str(e)
+    applied["intra_op_threads"] = tf.config.threading.get_intra_op_parallelism_threads()
+    applied["inter_op_threads"] = tf.config.threading.get_inter_op_parallelism_threads()
+    return applied
+
+
+def warm_up(model, batch_sizes=None, classifier=None):
+    """
+    compile لكل signature مستخدمة على كل bucket، عشان ولا طلب (دفعة 3، دراسة، باقي TTA)
+    يوقف thread الـ inference على XLA compile:
+    - Keras: fused (الشرح مع التنبؤ) + predict (mode=async، TTA) + heatmaps (الشرح المؤجّل،
+      ?tta=on|auto، والكلاس المعروف) مهما كان AI_TTA_MODE، لأنه الطلب بيقدر يطلب TTA
+    - TFLite: نفسهم (الشرح دايماً على Keras) + الـ interpreter لكل bucket (explain=False)
+    """
+    explainer = get_explainer(model)
+    batch_sizes = sorted({bucket_size(min(size, explainer.max_batch_size), explainer.buckets)
+                          for size in (batch_sizes or explainer.buckets)})
+    for batch_size in batch_sizes:
+        x = np.zeros((batch_size, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+        class_indices = np.zeros(batch_size, dtype=np.int32)
+        explainer.predict_and_explain(x)
+        explainer.predict(x)
+        explainer(x, class_indices)
+        if classifier is not None:
+            classifier.predict(x)
+
+
+def get_explainer(model):
+    explainer = _EXPLAINERS.get(model)
+    if explainer is None:
+        explainer = GradCamExplainer(model)
+        _EXPLAINERS[model] = explainer
+    return explainer
 
 
+def gradcam(model, x, class_index):
+    if len(x.shape) == 3:
+        x = tf.expand_dims(x, axis=0)
 
-def array_to_base64(img_array):
-    # img_array = RGB uint8
-    _, buffer = cv2.imencode(".png", cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR))
-    img_bytes = buffer.tobytes()
-    img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-    return img_b64
+    heatmaps, last_conv_name = gradcam_batch(model, x, [class_index])
+    return heatmaps[0], last_conv_name
 
 
+def gradcam_batch(model, x, class_indices):
+    # Grad-CAM لدفعة كاملة بتمريرة واحدة: كل صورة تأخذ الكلاس الخاص فيها
+    explainer = get_explainer(model)
+    return explainer(x, class_indices), explainer.last_conv_name
 
 
 
 
 def predict_and_explain(model, img_path):
-    orig = load_original_rgb(img_path)
-    x = load_preprocessed(img_path)
-
-    probs = model.predict(
-        {"input_layer_1": x},
-        verbose=0
-    )[0]
-
-    pred_idx = int(np.argmax(probs))
-    pred_label = CLASS_NAMES[pred_idx]
-
-    heatmap, conv_name = gradcam(model, x, pred_idx)
-    heatmap_img, overlay = overlay_heatmap_and_box(orig, heatmap)
-
-    return {
-        "pred_label": pred_label,
-        "probs": probs.tolist(),
-        "overlay": array_to_base64(overlay),
-        "heatmap": array_to_base64(heatmap_img),
-        "last_conv": conv_name
-    }
+    orig, x = load_inputs(img_path)
+    result = predict_and_explain_batch(model, [x])[0]
+
+    heatmap_grid = result.pop("heatmap_grid")
+    result["regions"] = find_regions(heatmap_grid, orig.shape[:2])
+    heatmap_img, overlay = overlay_heatmap_and_box(orig, heatmap_grid, regions=result["regions"])
+    result["overlay"] = array_to_base64(overlay)
+    result["heatmap"] = array_to_base64(heatmap_img)
+    return result
+
+
+def _shift_horizontal(x, dx):
+    # إزاحة مع تكرار الحافة بدل الأسود، عشان ما نضيف حواف مش موجودة بالصورة
+    if dx > 0:
+        return np.pad(x, ((0, 0), (0, 0), (dx, 0), (0, 0)), mode="edge")[:, :, :x.shape[2]]
+    return np.pad(x, ((0, 0), (0, 0), (0, -dx), (0, 0)), mode="edge")[:, :, -dx:]
+
+
+def tta_views(x, shift=AI_TTA_SHIFT, include_original=True):
+    # (N, H, W, 3) -> (V * N, H, W, 3): الأصل، قلب أفقي، إزاحة يمين ويسار
+    views = [x, x[:, :, ::-1]] if include_original else [x[:, :, ::-1]]
+    if shift:
+        views += [_shift_horizontal(x, shift), _shift_horizontal(x, -shift)]
+    return np.concatenate(views, axis=0)
+
+
+def _forward(explainer, classifier, x):
+    # (probs, embeddings)؛ الـ TFLite ما بيطلع embeddings
+    if classifier is not None:
+        return classifier.predict(x), None
+    return explainer.predict(x, with_embeddings=True)
+
+
+def predict_and_explain_batch(model, xs, classifier=None, explain=True, tta=False, known=None):
+    # xs = [x, ...] كل واحد (1, IMG_SIZE, IMG_SIZE, 3) كما ترجعها decode_image_bytes
+    # النتيجة فيها heatmap_grid الخام، والرسم/الترميز بيصير برا thread الـ inference
+    # timings (ثواني) للدفعة كاملة: forward / gradcam أو forward_gradcam لما يكونوا بتمريرة وحدة
+    # embedding من نفس التمريرة؛ مع الـ TFLite (بدون شرح) ما في تمريرة Keras فبيكون None
+    # known = [نتيجة سابقة أو None لكل صورة] عشان ما نعيد شغل انعمل:
+    # - مع tta: نتيجة التمريرة العادية، فبس النسخ المعدّلة بتمرق forward، والـ heatmap
+    #   بينعاد استخدامه إلا إذا الكلاس تغيّر بعد المتوسط
+    # - بدون tta: الاحتمالات النهائية (مثلاً من TTA)، فبس الـ Grad-CAM على الكلاس المعروف
+    # الـ classifier (TFLite) بس مع explain=False: مع الشرح تمريرة Keras الموحّدة أسرع من
+    # TFLite + forward/backward على Keras، والاحتمالات بتطلع من نفس الموديل تبع الـ heatmap
+    x = np.concatenate(xs, axis=0)
+    if explain:
+        classifier = None
+    known = known or [None] * len(xs)
+
+    explainer = get_explainer(model)
+    heatmaps = embeddings = None
+    timings = {}
+    started = time.perf_counter()
+    if tta:
+        # كل النسخ المعدّلة لكل الصور بتمريرة forward وحدة (والأصل بس للصور اللي ما إلها
+        # تمريرة عادية)، ومتوسط الاحتمالات لكل صورة مع الأصل
+        missing = [i for i, k in enumerate(known) if k is None]
+        augmented = tta_views(x, include_original=False)
+        forward = np.concatenate([augmented, x[missing]], axis=0) if missing else augmented
+        view_probs, view_embeddings = _forward(explainer, classifier, forward)
+        split = len(augmented)
+
+        original_probs = np.empty((len(xs), view_probs.shape[-1]), dtype=np.float32)
+        original_probs[missing] = view_probs[split:]
+        embeddings = [None] * len(xs)
+        for j, i in enumerate(missing):
+            embeddings[i] = view_embeddings[split + j] if view_embeddings is not None else None
+        for i, k in enumerate(known):
+            if k is not None:
+                original_probs[i] = k["probs"]
+                embeddings[i] = k.get("embedding")
+
+        augmented_probs = view_probs[:split].reshape(-1, len(xs), view_probs.shape[-1])
+        views_per_image = len(augmented_probs) + 1
+        probs = (original_probs + augmented_probs.sum(axis=0)) / views_per_image
+        pred_idx = np.argmax(probs, axis=1)
+        timings["forward"] = time.perf_counter() - started
+
+        if explain:
+            # الـ Grad-CAM بس على الصورة الأصلية، وبس إذا ما في heatmap لنفس الكلاس
+            heatmaps = [None] * len(xs)
+            redo = []
+            for i, k in enumerate(known):
+                if k is not None and k.get("heatmap_grid") is not None and np.argmax(k["probs"]) == pred_idx[i]:
+                    heatmaps[i] = k["heatmap_grid"]
+                else:
+                    redo.append(i)
+            if redo:
+                started = time.perf_counter()
+                redo_heatmaps, redo_embeddings = explainer(x[redo], pred_idx[redo].astype(np.int32), with_embeddings=True)
+                for j, i in enumerate(redo):
+                    heatmaps[i] = redo_heatmaps[j]
+                    if embeddings[i] is None:
+                        embeddings[i] = redo_embeddings[j]
+                timings["gradcam"] = time.perf_counter() - started
+    elif any(k is not None for k in known):
+        # التنبؤ معروف (ومع TTA ممكن يكون غير الـ argmax تبع التمريرة العادية)، بس الشرح ناقص
+        probs = np.asarray([k["probs"] for k in known], dtype=np.float32)
+        pred_idx = np.argmax(probs, axis=1)
+        heatmaps, embeddings = explainer(x, pred_idx.astype(np.int32), with_embeddings=True)
+        timings["gradcam"] = time.perf_counter() - started
+    elif classifier is None:
+        if explain:
+            probs, heatmaps, embeddings = explainer.predict_and_explain(x, with_embeddings=True)
+            timings["forward_gradcam"] = time.perf_counter() - started
+        else:
+            probs, embeddings = explainer.predict(x, with_embeddings=True)
+            timings["forward"] = time.perf_counter() - started
+        pred_idx = np.argmax(probs, axis=1)
+    else:
+        # التنبؤ بس (explain=False) من الـ backend المكمّم
+        probs = classifier.predict(x)
+        pred_idx = np.argmax(probs, axis=1)
+        timings["forward"] = time.perf_counter() - started
+    conv_name = explainer.last_conv_name
+
+    results = []
+    for i in range(len(xs)):
+        results.append({
+            "pred_label": CLASS_NAMES[int(pred_idx[i])],
+            "probs": probs[i].tolist(),
+            "heatmap_grid": heatmaps[i] if heatmaps is not None else None,
+            "embedding": embeddings[i] if embeddings is not None else None,
+            "last_conv": conv_name,
+            "timings": dict(timings)
+        })
+        if tta:
+            results[-1]["tta_views"] = views_per_image
+
+    return results
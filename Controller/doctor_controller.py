@@ -10,6 +10,7 @@ from fastapi.security import OAuth2PasswordBearer
 from typing import Optional
 import os
 from bson import ObjectId
+from core.uploads import CV_KINDS, CV_UPLOAD_MAX_BYTES, stream_upload
 from model.doctor_model import UpdateDoctorModel,LoginDoctorModel
 from database import mongo_db ,temp_doctors_collection,otp_collection
 from model.otp_model import OTPRequest, OTPVerifyRequest
@@ -120,12 +121,6 @@ async def register_doctor_temp(
     role: str,
     cv_file: UploadFile = File(...)
 ):
-    # ---------------- التحقق من صيغة الملف ----------------
-    if not (cv_file.content_type.startswith("image/") or cv_file.content_type in [
-        "application/pdf", "application/x-pdf", "application/octet-stream"
-    ]):
-        raise HTTPException(status_code=400, detail="صيغة الملف غير مدعومة. استخدم PDF أو صورة.")
-
     # ---------------- التحقق من عدم وجود حساب ----------------
     existing_doctor = await doctors_collection.find_one({
         "$or": [{"email": email}, {"username": username}]
@@ -137,11 +132,12 @@ async def register_doctor_temp(
     await temp_doctors_collection.delete_one({"email": email})
 
     # ---------------- حفظ CV ----------------
-    ext = cv_file.filename.split(".")[-1]
-    file_path = os.path.join(UPLOAD_DIR, f"{username}_cv.{ext}")
-
-    with open(file_path, "wb") as f:
-        f.write(await cv_file.read())
+    # الصيغة (PDF أو صورة) بتنفحص من محتوى الملف نفسه أثناء الكتابة
+    cv = await stream_upload(
+        cv_file, CV_KINDS, CV_UPLOAD_MAX_BYTES,
+        dest_path=os.path.join(UPLOAD_DIR, f"{username}_cv.{{ext}}")
+    )
+    file_path = cv.path
 
     # ---------------- تشفير كلمة المرور ----------------
     hashed_password = bcrypt_context.hash(password)
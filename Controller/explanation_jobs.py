@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExplanationJobs:
+    """
+    شغل الـ Grad-CAM المؤجل (mode=async): التنبؤ بيرجع للعميل فوراً،
+    والشرح بيتحسب بالخلفية وبينحفظ على نفس سجل predictions_collection.
+    wait() بتسمح لـ SSE تستنى الشغل على نفس الـ worker بدل ما تضل تسأل Mongo.
+
+    الشغل عايش بذاكرة الـ process، فلو الـ worker رجع اشتغل السجل بيضل "pending" للأبد.
+    كل شغلة إلها timeout_seconds، فأي سجل pending أقدم من ضعفها أكيد ما حدا شغال عليه،
+    و fail_stale() (عند الـ startup ودورياً) بتعلّمه failed.
+    """
+
+    def __init__(self, collection, timeout_seconds=300):
+        self.collection = collection
+        self.timeout_seconds = timeout_seconds
+        self._events = {}
+        self._tasks = set()
+
+    async def ensure_indexes(self):
+        # السجلات الـ pending قليلة، فـ partial index بيخلي الـ sweep ما يمسح كل المجموعة
+        await self.collection.create_index(
+            "uploaded_at", name="explanation_pending_uploaded_at",
+            partialFilterExpression={"explanation_status": "pending"}
+        )
+
+    async def fail_stale(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=2 * self.timeout_seconds)
+        result = await self.collection.update_many(
+            {"explanation_status": "pending", "uploaded_at": {"$lt": cutoff}},
+            {"$set": {"explanation_status": "failed", "explanation_error": "Explanation job was interrupted"}}
+        )
+        if result.modified_count:
+            logger.warning("Marked %d interrupted explanation jobs as failed", result.modified_count)
+        return result.modified_count
+
+    def start(self, job_id, coro):
+        event = asyncio.Event()
+        self._events[job_id] = event
+        task = asyncio.get_running_loop().create_task(self._run(job_id, coro, event))
+        # لازم نحتفظ بمرجع للـ task لحد ما يخلص
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, job_id, coro, event):
+        try:
+            await coro
+        except Exception:
+            logger.exception("Explanation job %s failed", job_id)
+        finally:
+            event.set()
+            self._events.pop(job_id, None)
+
+    async def wait(self, job_id, timeout):
+        event = self._events.get(job_id)
+        if event is None:
+            await asyncio.sleep(timeout)
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def pending(self):
+        return len(self._events)
@@ -0,0 +1,97 @@
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from starlette.concurrency import run_in_threadpool
+
+from Controller.prediction_cache import pack_heatmap_grid, unpack_heatmap_grid
+
+
+class ExplanationStore:
+    """
+    روابط قصيرة العمر لصور الشرح (overlay / heatmap).
+    الرابط سجل بـ Mongo (بيمسحه TTL index) فيه الـ heatmap الصغير ومرجع للصورة:
+    مسار الصورة المحفوظة، أو PNG لصورة العرض إذا حفظ الرفع مطفي. فأي worker بيقدر يخدم الرابط.
+    بالذاكرة بس الصور المرسومة، بـ LRU محدود بالحجم متل PredictionCache.
+    """
+
+    def __init__(self, collection, ttl_seconds=300, max_bytes=32 * 1024 * 1024):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max(1, int(max_bytes))
+        self._rendered = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def put(self, heatmap_grid, image_path=None, display_png=None):
+        token = secrets.token_urlsafe(16)
+        link = {
+            "_id": token,
+            "explanation": pack_heatmap_grid(heatmap_grid),
+            "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        }
+        if image_path:
+            link["image_path"] = image_path
+        else:
+            link["display_png"] = display_png
+        await self.collection.insert_one(link)
+        return token
+
+    # ---------------- الصور المرسومة (محلي) ----------------
+    def _cached(self, key):
+        with self._lock:
+            entry = self._rendered.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= datetime.utcnow():
+                self._bytes -= self._rendered.pop(key)[2]
+                return None
+            self._rendered.move_to_end(key)
+            return entry[1]
+
+    def _store(self, key, expires_at, rendered):
+        size = len(rendered["overlay"]) + len(rendered["heatmap"])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._rendered:
+                self._bytes -= self._rendered.pop(key)[2]
+            self._rendered[key] = (expires_at, rendered, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._rendered.popitem(last=False)
+                self._bytes -= evicted_size
+
+    @staticmethod
+    def _render(link, image_format, quality, render_fn, decode_fn):
+        if "image_path" in link:
+            with open(link["image_path"], "rb") as f:
+                data = f.read()
+        else:
+            data = link["display_png"]
+        return render_fn(decode_fn(data), unpack_heatmap_grid(link["explanation"]), image_format, quality)
+
+    async def render(self, token, kind, image_format, quality, render_fn, decode_fn):
+        # render_fn(orig, heatmap_grid, image_format, quality) -> {"overlay", "heatmap", "media_type"}
+        # decode_fn(bytes) -> صورة العرض RGB uint8
+        key = (token, image_format, quality)
+        rendered = self._cached(key)
+        if rendered is None:
+            # الـ TTL index بيمسح بتأخير لحد دقيقة، فالصلاحية بتنفحص هون كمان
+            link = await self.collection.find_one({"_id": token, "expires_at": {"$gt": datetime.utcnow()}})
+            if link is None:
+                return None
+            try:
+                rendered = await run_in_threadpool(self._render, link, image_format, quality, render_fn, decode_fn)
+            except FileNotFoundError:
+                return None
+            self._store(key, link["expires_at"], rendered)
+        return rendered[kind], rendered["media_type"]
+
+    def stats(self):
+        with self._lock:
+            return {"rendered_entries": len(self._rendered), "bytes": self._bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,171 @@
+"""
+عمليات الصور اللي ما بتحتاج TensorFlow: فك الصورة وتجهيز الـ tensor، مناطق الاشتباه
+من شبكة الـ Grad-CAM، الرسم والترميز. الـ web workers (وسيرفر الـ inference) بيستوردوها
+من هون، فـ worker بيبعت لسيرفر inference مشترك ما بيحمّل TensorFlow أبداً.
+"""
+import base64
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from core.ai_config import AI_REGION_MAX, AI_REGION_MIN_AREA, AI_REGION_THRESHOLD
+
+
+IMG_SIZE = 456
+CLASS_NAMES = ["benign", "malignant", "normal"]
+
+
+def get_bbox_from_heatmap(heatmap, thresh=0.80, use_largest_cc=True):
+    mask = (heatmap >= thresh).astype(np.uint8)
+
+    if mask.sum() == 0:
+        return None
+
+    if use_largest_cc:
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        if num_labels <= 1:
+            return None
+
+        largest = 1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])
+        mask = (labels == largest).astype(np.uint8)
+
+        if mask.sum() == 0:
+            return None
+
+    ys, xs = np.where(mask == 1)
+    y1, y2 = int(ys.min()), int(ys.max())
+    x1, x2 = int(xs.min()), int(xs.max())
+    return x1, y1, x2, y2
+
+
+def find_regions(heatmap_grid, image_shape=(IMG_SIZE, IMG_SIZE), thresh=None, min_area=None, max_regions=None):
+    """
+    كل المناطق المشبوهة من شبكة الـ Grad-CAM الأصلية (مثلاً 15×15) بدون upsampling:
+    connected components على الشبكة الصغيرة، والإحصائيات لكل منطقة بعمليات vectorized،
+    وبعدها الـ boxes بتتكبّر لأبعاد الصورة. مرتبة حسب score = متوسط الشدة بالمنطقة × أعلى قيمة فيها.
+    """
+    thresh = AI_REGION_THRESHOLD if thresh is None else thresh
+    min_area = AI_REGION_MIN_AREA if min_area is None else min_area
+    max_regions = AI_REGION_MAX if max_regions is None else max_regions
+
+    grid = np.asarray(heatmap_grid, dtype=np.float32)
+    mask = (grid >= thresh).astype(np.uint8)
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if num_labels <= 1:
+        return []
+
+    flat_labels = labels.ravel()
+    values = grid.ravel()
+    areas = stats[:, cv2.CC_STAT_AREA]
+    means = np.bincount(flat_labels, weights=values, minlength=num_labels) / np.maximum(areas, 1)
+    peaks = np.zeros(num_labels, dtype=np.float32)
+    np.maximum.at(peaks, flat_labels, values)
+
+    grid_h, grid_w = grid.shape
+    scale_y, scale_x = image_shape[0] / grid_h, image_shape[1] / grid_w
+    x1 = np.floor(stats[:, cv2.CC_STAT_LEFT] * scale_x).astype(int)
+    y1 = np.floor(stats[:, cv2.CC_STAT_TOP] * scale_y).astype(int)
+    x2 = np.ceil((stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH]) * scale_x).astype(int) - 1
+    y2 = np.ceil((stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT]) * scale_y).astype(int) - 1
+
+    area_fractions = areas / float(grid_h * grid_w)
+    keep = np.flatnonzero(area_fractions >= min_area)
+    keep = keep[keep > 0]  # 0 = الخلفية
+    keep = keep[np.argsort(-(means[keep] * peaks[keep]), kind="stable")][:max_regions]
+
+    return [
+        {
+            "box": [int(x1[i]), int(y1[i]), int(x2[i]), int(y2[i])],
+            "score": round(float(means[i] * peaks[i]), 4),
+            "peak": round(float(peaks[i]), 4),
+            "area": round(float(area_fractions[i]), 4)
+        }
+        for i in keep
+    ]
+
+
+def overlay_heatmap_and_box(img, heatmap, alpha=0.35, thresh=None, regions=None):
+    # heatmap = الشبكة الأصلية؛ الـ boxes من find_regions إذا ما انبعتت جاهزة
+    if regions is None:
+        regions = find_regions(heatmap, img.shape[:2], thresh=thresh)
+
+    heatmap = cv2.resize(heatmap, (img.shape[1], img.shape[0]))
+    heatmap_uint8 = np.uint8(255 * heatmap)
+
+    heatmap_color = cv2.applyColorMap(heatmap_uint8, cv2.COLORMAP_JET)
+    heatmap_color = cv2.cvtColor(heatmap_color, cv2.COLOR_BGR2RGB)
+
+    overlay = cv2.addWeighted(img, 1 - alpha, heatmap_color, alpha, 0)
+
+    for rank, region in enumerate(regions):
+        x1, y1, x2, y2 = region["box"]
+        # أقوى منطقة بخط أعرض
+        cv2.rectangle(overlay, (x1, y1), (x2, y2), (0, 255, 0), 4 if rank == 0 else 2)
+
+    return heatmap_color, overlay
+
+
+
+IMAGE_FORMATS = {
+    "png": (".png", "image/png"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+}
+
+
+def encode_image(img_array, image_format="png", quality=None):
+    # img_array = RGB uint8
+    ext, _ = IMAGE_FORMATS[image_format]
+    params = []
+    if image_format == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality or 85)]
+    elif image_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(quality or 80)]
+
+    _, buffer = cv2.imencode(ext, cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR), params)
+    return buffer.tobytes()
+
+
+def array_to_base64(img_array, image_format="png", quality=None):
+    img_bytes = encode_image(img_array, image_format, quality)
+    img_b64 = base64.b64encode(img_bytes).decode("utf-8")
+    return img_b64
+
+
+def render_explanation(orig, heatmap_grid, image_format="png", quality=None):
+    # الرسم والترميز بيصير بس لما العميل يطلب الصور، وبالصيغة اللي طلبها
+    heatmap_img, overlay = overlay_heatmap_and_box(orig, heatmap_grid)
+    return {
+        "overlay": encode_image(overlay, image_format, quality),
+        "heatmap": encode_image(heatmap_img, image_format, quality),
+        "media_type": IMAGE_FORMATS[image_format][1]
+    }
+
+
+def decode_rgb(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.convert("RGB")
+
+
+def preprocess_rgb(img):
+    # نفس الـ interpolation الافتراضي تبع keras_image.load_img
+    img = img.resize((IMG_SIZE, IMG_SIZE), Image.NEAREST)
+    orig = np.asarray(img, dtype=np.uint8)
+
+    # preprocess_input تبع EfficientNetV2 ما بيعمل إشي (الـ rescaling جوا الموديل)،
+    # فالـ tensor هو نفس البكسلات float32 بدون ما نحتاج TensorFlow هون
+    x = orig.astype(np.float32)[np.newaxis]
+    return orig, x
+
+
+def decode_image_bytes(data):
+    # فك الصورة مرة وحدة من الذاكرة: نفس الـ buffer بعد الـ resize
+    # بيطلع منه الـ uint8 للعرض والـ tensor المجهز للموديل
+    return preprocess_rgb(decode_rgb(data))
+
+
+def load_inputs(img_path):
+    with open(img_path, "rb") as f:
+        return decode_image_bytes(f.read())
@@ -2,8 +2,8 @@ from fastapi import UploadFile, HTTPException
 from sqlalchemy.orm import Session
 from model.images_model import Images
 from pathlib import Path
-import shutil
 import uuid
+from core.uploads import PROFILE_IMAGE_MAX_BYTES, stream_upload
 
 # مجلد حفظ الصور
 UPLOAD_DIR = Path("uploads")
@@ -13,19 +13,18 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 ALLOWED_EXTENSIONS = (".jpg", ".jpeg", ".png")
 
 # ---------------- رفع صورة واحدة ----------------
-def upload_to_local(file: UploadFile, user_id: int, db: Session):
+async def upload_to_local(file: UploadFile, user_id: int, db: Session):
     if not file.filename.lower().endswith(ALLOWED_EXTENSIONS):
         raise HTTPException(status_code=400, detail="الملف يجب أن يكون JPG أو PNG فقط")
 
-    try:
-        # إنشاء اسم فريد للصورة
-        filename = f"{uuid.uuid4().hex}_{file.filename.lower()}"
-        file_path = UPLOAD_DIR / filename
+    # إنشاء اسم فريد للصورة
+    filename = f"{uuid.uuid4().hex}_{file.filename.lower()}"
+    file_path = UPLOAD_DIR / filename
 
-        # حفظ الصورة على السيرفر
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    # حفظ الصورة على السيرفر بأجزاء وبرا الـ event loop
+    await stream_upload(file, ("jpeg", "png"), PROFILE_IMAGE_MAX_BYTES, dest_path=str(file_path))
 
+    try:
         # حفظ معلومات الصورة في قاعدة البيانات
         new_image = Images(
             filename=filename,
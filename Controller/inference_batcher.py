@@ -0,0 +1,184 @@
+import asyncio
+import itertools
+import logging
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    pass
+
+
+class InferenceBatcher:
+    """
+    يجمع طلبات الـ AI المتزامنة في دفعات (micro-batching):
+    ينتظر حتى max_batch_size طلب أو max_wait_ms، ثم يشغّل run_batch مرة واحدة
+    ويرجّع لكل طلب نتيجته.
+
+    التنفيذ كله على thread واحد مخصص يملك الموديل، عشان الـ event loop
+    يضل فاضي لباقي الـ API. الطابور محدود بـ max_queue وإذا امتلأ
+    submit ترمي InferenceQueueFull.
+
+    الطابور بأولوية: الرقم الأصغر بيطلع أول (دكتور قبل مريض)، ونفس الأولوية بترتيب الوصول.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=15, max_queue=64, name="ai-inference"):
+        # run_batch(items) -> list of results بنفس الترتيب
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = max(1, int(max_queue))
+        self.name = name
+
+        self._queue = queue.PriorityQueue(maxsize=self.max_queue)
+        self._sequence = itertools.count()
+        self._worker = None
+        self._lock = threading.Lock()
+        # الإضافة للطابور بتمرق من هون بس (الـ worker بيسحب)، فتحت هالقفل المكان الفاضي
+        # اللي انفحص ما بيصغر قبل ما تنحط الطلبات
+        self._submit_lock = threading.Lock()
+
+        # ---------------- metrics ----------------
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._batches = 0
+        self._started = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+        self._batch_seconds = None  # متوسط متحرك لزمن الدفعة، لتقدير الانتظار
+        self._running = False
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def submit_future(self, item, priority=0):
+        return self.submit_many([(item, priority)])[0]
+
+    def submit_many(self, entries):
+        # entries = [(item, priority), ...]: يا كلهم بيدخلوا الطابور يا ولا واحد، عشان
+        # ما تنشغل طلبات من مجموعة مرفوضة ونتايجها بتنرمى
+        self._ensure_worker()
+        futures = [Future() for _ in entries]
+        with self._submit_lock:
+            if self._queue.qsize() + len(entries) > self._queue.maxsize:
+                with self._lock:
+                    self._rejected += len(entries)
+                raise InferenceQueueFull(f"AI queue is full ({self.max_queue} pending)")
+            enqueued = time.perf_counter()
+            for (item, priority), future in zip(entries, futures):
+                self._queue.put_nowait((priority, next(self._sequence), item, future, enqueued))
+
+        with self._lock:
+            self._submitted += len(entries)
+        return futures
+
+    async def submit(self, item, priority=0):
+        return await asyncio.wrap_future(self.submit_future(item, priority))
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        # الطلبات اللي العميل لغاها ما في داعي نشغلها
+        return [entry[2:] for entry in batch if entry[3].set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            self._record_waits([started - enqueued for _, _, enqueued in batch])
+
+            self._running = True
+            try:
+                results = self.run_batch([item for item, _, _ in batch])
+            except Exception as e:
+                self._running = False
+                logger.exception("Inference batch of %d failed", len(batch))
+                with self._lock:
+                    self._failed += len(batch)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            self._running = False
+            self._record_batch_seconds(time.perf_counter() - started)
+            with self._lock:
+                self._completed += len(batch)
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def _record_waits(self, waits):
+        with self._lock:
+            self._batches += 1
+            self._started += len(waits)
+            self._wait_total += sum(waits)
+            self._wait_max = max(self._wait_max, *waits)
+            self._wait_last = waits[-1]
+
+    def _record_batch_seconds(self, seconds):
+        with self._lock:
+            if self._batch_seconds is None:
+                self._batch_seconds = seconds
+            else:
+                self._batch_seconds = 0.8 * self._batch_seconds + 0.2 * seconds
+
+    def queue_depth(self, priority=None):
+        # priority: عدد الطلبات اللي رح تطلع قبل طلب جديد بهالأولوية
+        if priority is None:
+            return self._queue.qsize()
+        with self._queue.mutex:
+            return sum(1 for entry in self._queue.queue if entry[0] <= priority)
+
+    def estimated_wait(self, priority=None, items=1):
+        # ثواني تقريبية لحد ما تخلص items طلبات جديدة؛ None قبل أول دفعة
+        with self._lock:
+            batch_seconds = self._batch_seconds
+        if batch_seconds is None:
+            return None
+        ahead = self.queue_depth(priority)
+        # الدفعة الشغالة هلأ (إذا في)، وبعدها الدفعات اللي قبلنا ودفعاتنا
+        batches = int(self._running) + math.ceil((ahead + items) / self.max_batch_size)
+        return batch_seconds * batches
+
+    def stats(self):
+        with self._lock:
+            started = self._started
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "max_batch_size": self.max_batch_size,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "failed": self._failed,
+                "batches": self._batches,
+                "avg_batch_size": round(started / self._batches, 2) if self._batches else 0.0,
+                "wait_ms_avg": round(1000 * self._wait_total / started, 2) if started else 0.0,
+                "wait_ms_max": round(1000 * self._wait_max, 2),
+                "wait_ms_last": round(1000 * self._wait_last, 2),
+                "batch_ms_avg": round(1000 * self._batch_seconds, 2) if self._batch_seconds is not None else None,
+            }
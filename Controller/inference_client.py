@@ -0,0 +1,116 @@
+import ipaddress
+import logging
+import queue
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+from fastapi import HTTPException
+
+from Controller.inference_batcher import InferenceQueueFull
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_address(address):
+    # "host:port" = TCP على localhost بس، غير هيك مسار Unix socket.
+    # الرسائل بتتفك بـ pickle، فالسيرفر ما لازم يكون ظاهر على الشبكة
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        host = host.strip("[]") or "127.0.0.1"
+        if not is_loopback(host):
+            raise ValueError(f"Inference server address must be a Unix socket or a loopback host, got {host}")
+        return host, int(port)
+    return address
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def require_authkey(authkey):
+    if not authkey:
+        raise RuntimeError("AI_INFERENCE_AUTHKEY must be set to use the shared inference server")
+    return authkey
+
+
+class InferenceClient:
+    """
+    عميل خفيف لسيرفر الـ inference (Controller/inference_server.py) بدون TensorFlow.
+    كل طلب = (op, kwargs) والرد = ("ok", result) أو ("http_error", status, detail, headers)
+    أو ("queue_full", message) لما طابور السيرفر مليان.
+    الاتصالات بتنعاد استخدامها من pool صغير، وأي اتصال خرب بيتسكّر وبيرجع 503.
+    """
+
+    def __init__(self, address, authkey, timeout=120.0, pool_size=4):
+        self.address = parse_address(address)
+        self.authkey = require_authkey(authkey)
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._failures = 0
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return Client(self.address, authkey=self.authkey)
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _unavailable(self, error):
+        with self._lock:
+            self._failures += 1
+        logger.warning("Inference server %s unavailable: %s", self.address, error)
+        return HTTPException(
+            status_code=503,
+            detail="خادم تحليل الصور غير متاح حالياً، حاول مرة أخرى بعد قليل",
+            headers={"Retry-After": "5"}
+        )
+
+    def call(self, op, **kwargs):
+        with self._lock:
+            self._calls += 1
+        try:
+            conn = self._acquire()
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise self._unavailable(e)
+
+        try:
+            conn.send((op, kwargs))
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"no reply to {op} within {self.timeout}s")
+            reply = conn.recv()
+        except (OSError, EOFError, TimeoutError) as e:
+            conn.close()
+            raise self._unavailable(e)
+        self._release(conn)
+
+        if reply[0] == "ok":
+            return reply[1]
+        if reply[0] == "http_error":
+            _, status_code, detail, headers = reply
+            raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+        if reply[0] == "queue_full":
+            raise InferenceQueueFull(reply[1])
+        raise RuntimeError(reply[1])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "address": self.address,
+                "calls": self._calls,
+                "failures": self._failures,
+                "idle_connections": self._idle.qsize()
+            }
@@ -0,0 +1,139 @@
+"""
+سيرفر inference محلي واحد بيملك الموديل، وكل uvicorn workers بيبعتوله عبر Unix socket أو localhost.
+الـ batcher هون بيجمع طلبات كل الـ workers بنفس الدفعة، والذاكرة و thread pools تبع
+TensorFlow بتكون مرة وحدة مهما زاد عدد الـ workers.
+
+    export AI_INFERENCE_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+    AI_INFERENCE_SERVER=/tmp/mammo-inference.sock python -m Controller.inference_server
+    AI_INFERENCE_SERVER=/tmp/mammo-inference.sock uvicorn main:app --workers 4
+
+العنوان لازم يكون Unix socket أو host:port على loopback، و AI_INFERENCE_AUTHKEY إجباري.
+"""
+import argparse
+import logging
+import os
+import threading
+from multiprocessing.connection import Listener
+
+from fastapi import HTTPException
+
+from core.ai_config import (
+    AI_INFERENCE_AUTHKEY, AI_INFERENCE_SERVER, AI_MAX_BATCH_SIZE
+)
+from Controller.inference_batcher import InferenceBatcher, InferenceQueueFull
+from Controller.inference_client import parse_address, require_authkey
+from Controller.model_manager import ModelRegistry
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = "/tmp/mammo-inference.sock"
+
+
+class InferenceServer:
+    def __init__(self, address, authkey, registry=None, max_wait_ms=15, max_queue=256):
+        self.address = parse_address(address)
+        self.authkey = require_authkey(authkey)
+        # registry محلي دايماً، حتى لو AI_INFERENCE_SERVER مضبوط بنفس الـ environment
+        self.registry = registry or ModelRegistry()
+        self.batcher = InferenceBatcher(
+            self.registry.predict_and_explain_batch,
+            max_batch_size=AI_MAX_BATCH_SIZE,
+            max_wait_ms=max_wait_ms,
+            max_queue=max_queue,
+            name="ai-inference-server"
+        )
+        self._connections = 0
+        self._connections_lock = threading.Lock()
+
+    # ---------------- العمليات ----------------
+    def predict(self, items):
+        # items = [(version, x, explain, tta, known, priority), ...]؛ كل عنصر بيدخل الطابور المشترك
+        # لحاله بأولويته، فطلب دكتور من worker ما بيستنى ورا شغل خلفية من worker تاني.
+        # كل النسخ بتنفحص والمكان بالطابور بيتحجز للطلب كامل قبل ما يدخل أي عنصر
+        entries = []
+        for version, x, explain, tta, known, priority in items:
+            manager = self.registry.models.get(version)
+            if manager is None or not manager.ready:
+                raise HTTPException(status_code=409, detail=f"Model version {version} is not ready")
+            entries.append(((manager, x, explain, tta, known, priority), priority))
+        futures = self.batcher.submit_many(entries)
+        return [future.result() for future in futures]
+
+    def status(self):
+        status = self.registry.status()
+        status["inference_server"] = {
+            "connections": self._connections,
+            "pid": os.getpid(),
+            "queue": self.batcher.stats()
+        }
+        return status
+
+    def handle(self, op, kwargs):
+        if op == "predict":
+            return self.predict(**kwargs)
+        if op == "status":
+            return self.status()
+        if op in ("load", "activate", "set_traffic", "unload"):
+            return getattr(self.registry, op)(**kwargs)
+        raise ValueError(f"Unknown inference server op: {op}")
+
+    # ---------------- الاتصالات ----------------
+    def _serve_connection(self, conn):
+        with self._connections_lock:
+            self._connections += 1
+        try:
+            while True:
+                try:
+                    op, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ("ok", self.handle(op, kwargs))
+                except HTTPException as e:
+                    reply = ("http_error", e.status_code, e.detail, e.headers)
+                except InferenceQueueFull as e:
+                    # العميل بيرجعها InferenceQueueFull، فبتنعد وبترجع 503 زي الطابور المحلي
+                    reply = ("queue_full", str(e))
+                except Exception as e:
+                    logger.exception("Inference server op %s failed", op)
+                    reply = ("error", str(e))
+                conn.send(reply)
+        finally:
+            with self._connections_lock:
+                self._connections -= 1
+            conn.close()
+
+    def serve_forever(self):
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+        self.registry.start()
+        with Listener(self.address, authkey=self.authkey) as listener:
+            logger.info("AI inference server listening on %s", self.address)
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.warning("Rejected inference connection: %s", e)
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared AI inference server")
+    parser.add_argument("--address", default=AI_INFERENCE_SERVER or DEFAULT_ADDRESS,
+                        help="Unix socket path or host:port")
+    parser.add_argument("--max-wait-ms", type=float, default=float(os.getenv("AI_MAX_WAIT_MS", "15")))
+    parser.add_argument("--max-queue", type=int, default=int(os.getenv("AI_SERVER_MAX_QUEUE", "256")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not AI_INFERENCE_AUTHKEY:
+        parser.error("AI_INFERENCE_AUTHKEY is not set; refusing to start the inference server")
+    InferenceServer(args.address, AI_INFERENCE_AUTHKEY, max_wait_ms=args.max_wait_ms,
+                    max_queue=args.max_queue).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
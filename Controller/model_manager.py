@@ -0,0 +1,416 @@
+import logging
+import random
+import threading
+import time
+
+from fastapi import HTTPException
+
+from core.ai_config import (
+    AI_BACKEND, AI_INFERENCE_AUTHKEY, AI_INFERENCE_SERVER, AI_INFERENCE_TIMEOUT,
+    AI_WARMUP_BATCH_SIZES, MODEL_PATH, MODEL_VERSION, TFLITE_MODEL_PATH
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class ModelManager:
+    """
+    تحميل موديل الماموجرام بالخلفية بعد تشغيل السيرفر، ثم تسخينه بدفعة أو دفعتين.
+    TensorFlow نفسه ما بيتستورد إلا داخل thread التحميل، فباقي الـ API بيرد فوراً.
+    مسارات الـ AI بترجع 503 + Retry-After لحد ما تصير الحالة ready.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, version=MODEL_VERSION, backend=AI_BACKEND,
+                 tflite_path=TFLITE_MODEL_PATH, warmup_batch_sizes=AI_WARMUP_BATCH_SIZES,
+                 retry_after_seconds=15, on_ready=None):
+        self.model_path = model_path
+        self.version = version
+        self.backend = backend
+        self.tflite_path = tflite_path
+        self.on_ready = on_ready
+        self.warmup_batch_sizes = warmup_batch_sizes
+        self.retry_after_seconds = retry_after_seconds
+
+        self.state = "not_loaded"  # not_loaded -> loading -> warming -> ready | failed
+        self.error = None
+        self.model = None
+        self.classifier = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.ready_at = None
+        self.threading = None
+
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "loading"
+            self._thread = threading.Thread(target=self._load, name="ai-model-loader", daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        try:
+            started = time.perf_counter()
+            from tensorflow.keras.models import load_model
+            from Controller import ai_controller
+
+            # قبل أول عملية TensorFlow: بروفايل الـ threads تبع هالجهاز
+            self.threading = ai_controller.apply_thread_profile()
+            if "error" in self.threading:
+                logger.warning("AI thread profile not applied: %s", self.threading["error"])
+
+            model = load_model(self.model_path)
+            classifier = ai_controller.load_classifier(self.backend, self.tflite_path)
+            self.load_seconds = round(time.perf_counter() - started, 2)
+
+            self.state = "warming"
+            started = time.perf_counter()
+            ai_controller.warm_up(model, self.warmup_batch_sizes, classifier=classifier)
+            self.warmup_seconds = round(time.perf_counter() - started, 2)
+
+            self.model = model
+            self.classifier = classifier
+            self.ready_at = time.time()
+            self.state = "ready"
+            logger.info("✅ AI model %s ready (load %.1fs, warm-up %.1fs)",
+                        self.version, self.load_seconds, self.warmup_seconds)
+
+            if self.on_ready is not None:
+                self.on_ready(self)
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            logger.exception("AI model failed to load from %s", self.model_path)
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def require_ready(self):
+        if self.ready:
+            return
+        if self.state == "failed":
+            raise HTTPException(status_code=503, detail="نموذج الذكاء الاصطناعي غير متاح حالياً")
+        raise HTTPException(
+            status_code=503,
+            detail="نموذج الذكاء الاصطناعي قيد التحميل، حاول مرة أخرى بعد قليل",
+            headers={"Retry-After": str(self.retry_after_seconds)}
+        )
+
+    def predict_and_explain_batch(self, xs, explain=True, tta=False, known=None):
+        from Controller.ai_controller import predict_and_explain_batch
+        results = predict_and_explain_batch(
+            self.model, xs, classifier=self.classifier, explain=explain, tta=tta, known=known
+        )
+        for result in results:
+            result["model_version"] = self.version
+        return results
+
+    def status(self):
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "model_version": self.version,
+            "model_path": self.model_path,
+            "backend": self.backend,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "ready_at": self.ready_at,
+            "threading": self.threading,
+            "error": self.error
+        }
+
+
+class ModelRegistry:
+    """
+    أكثر من نسخة موديل محمّلة بنفس الوقت، مع تبديل بدون توقف:
+    النسخة الجديدة بتتحمّل وتتسخّن بالخلفية، وبعدها active بيتبدّل بخطوة وحدة.
+    الطلبات الشغالة بتكمّل على النسخة اللي بدأت فيها.
+
+    candidate + split_percent: نسبة من الطلبات بتروح للنسخة الجديدة
+      - mode="ab":     الطلب بينخدم من الـ candidate
+      - mode="shadow": الطلب بينخدم من الـ active، والـ candidate بيشتغل جنبه للمقارنة فقط
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.active_version = None
+        self.candidate_version = None
+        self.split_percent = 0.0
+        self.mode = "ab"
+        self._lock = threading.Lock()
+
+    # ---------------- التحميل والتبديل ----------------
+    def load(self, version, model_path, backend=AI_BACKEND, tflite_path=TFLITE_MODEL_PATH,
+             activate=True, split_percent=0.0, mode="ab"):
+        if mode not in ("ab", "shadow"):
+            raise HTTPException(status_code=400, detail="mode must be 'ab' or 'shadow'")
+        if backend not in ("keras", "tflite"):
+            raise HTTPException(status_code=400, detail="backend must be 'keras' or 'tflite'")
+
+        with self._lock:
+            existing = self.models.get(version)
+            if existing is not None and existing.state != "failed":
+                raise HTTPException(status_code=400, detail=f"Model version {version} already exists")
+
+            def on_ready(manager):
+                with self._lock:
+                    if self.models.get(manager.version) is not manager:
+                        return
+                    if activate or self.active_version is None:
+                        self._activate(manager.version)
+                    elif split_percent > 0:
+                        self.candidate_version = manager.version
+                        self.split_percent = float(split_percent)
+                        self.mode = mode
+
+            manager = ModelManager(model_path=model_path, version=version, backend=backend,
+                                   tflite_path=tflite_path, on_ready=on_ready)
+            self.models[version] = manager
+
+        manager.start()
+        return manager.status()
+
+    def _activate(self, version):
+        previous = self.active_version
+        self.active_version = version
+        if self.candidate_version == version:
+            self.candidate_version = None
+            self.split_percent = 0.0
+        logger.info("AI traffic switched from %s to %s", previous, version)
+
+    def activate(self, version):
+        with self._lock:
+            manager = self.models.get(version)
+            if manager is None:
+                raise HTTPException(status_code=404, detail=f"Model version {version} not found")
+            if not manager.ready:
+                raise HTTPException(status_code=409, detail=f"Model version {version} is {manager.state}")
+            self._activate(version)
+        return self.status()
+
+    def set_traffic(self, candidate_version, split_percent, mode="ab"):
+        if mode not in ("ab", "shadow"):
+            raise HTTPException(status_code=400, detail="mode must be 'ab' or 'shadow'")
+        if not 0 <= split_percent <= 100:
+            raise HTTPException(status_code=400, detail="split_percent must be between 0 and 100")
+
+        with self._lock:
+            if candidate_version is not None:
+                manager = self.models.get(candidate_version)
+                if manager is None or not manager.ready:
+                    raise HTTPException(status_code=409, detail=f"Model version {candidate_version} is not ready")
+            self.candidate_version = candidate_version if split_percent > 0 else None
+            self.split_percent = float(split_percent) if self.candidate_version else 0.0
+            self.mode = mode
+        return self.status()
+
+    def unload(self, version):
+        with self._lock:
+            if version == self.active_version:
+                raise HTTPException(status_code=409, detail="Cannot unload the active model version")
+            if self.models.pop(version, None) is None:
+                raise HTTPException(status_code=404, detail=f"Model version {version} not found")
+            if self.candidate_version == version:
+                self.candidate_version = None
+                self.split_percent = 0.0
+        # الطلبات اللي لسا ماسكة الموديل بتكمّل، والذاكرة بتتحرر بعدها
+        return self.status()
+
+    def start(self):
+        # النسخة الافتراضية من core.ai_config عند تشغيل السيرفر
+        if not self.models:
+            self.load(MODEL_VERSION, MODEL_PATH)
+
+    # ---------------- اختيار الموديل لكل طلب ----------------
+    @property
+    def active(self):
+        return self.models.get(self.active_version)
+
+    def require_ready(self):
+        active = self.active
+        if active is None:
+            if self.models and all(m.state == "failed" for m in list(self.models.values())):
+                raise HTTPException(status_code=503, detail="نموذج الذكاء الاصطناعي غير متاح حالياً")
+            raise HTTPException(
+                status_code=503,
+                detail="نموذج الذكاء الاصطناعي قيد التحميل، حاول مرة أخرى بعد قليل",
+                headers={"Retry-After": "15"}
+            )
+        active.require_ready()
+
+    def choose(self):
+        # ترجع (الموديل اللي بيخدم الطلب، موديل shadow أو None)
+        self.require_ready()
+        with self._lock:
+            active = self.active
+            candidate = self.models.get(self.candidate_version)
+            split, mode = self.split_percent, self.mode
+
+        if candidate is None or not candidate.ready or random.random() * 100 >= split:
+            return active, None
+        if mode == "shadow":
+            return active, candidate
+        return candidate, None
+
+    @staticmethod
+    def predict_and_explain_batch(items):
+        # items = [(manager, x, explain, tta, known, priority), ...]؛ كل مجموعة بتشتغل على موديلها
+        # وطلبات explain=False ما بتدفع ثمن الـ backward. known = نتيجة سابقة أو None
+        # (بدون tta اللي معهم known بيتجمعوا لحالهم، لأنهم ما بيحتاجوا forward)
+        results = [None] * len(items)
+        groups = {}
+        for i, (manager, _, explain, tta, known, _) in enumerate(items):
+            key = (id(manager), explain, tta, known is not None and not tta)
+            groups.setdefault(key, (manager, explain, tta, []))[3].append(i)
+
+        for manager, explain, tta, indices in groups.values():
+            group_results = manager.predict_and_explain_batch(
+                [items[i][1] for i in indices], explain=explain, tta=tta, known=[items[i][4] for i in indices]
+            )
+            for i, result in zip(indices, group_results):
+                results[i] = result
+        return results
+
+    def status(self):
+        with self._lock:
+            active = self.active
+            return {
+                "ready": active is not None and active.ready,
+                "active_version": self.active_version,
+                "candidate_version": self.candidate_version,
+                "split_percent": self.split_percent,
+                "mode": self.mode,
+                "models": {version: manager.status() for version, manager in self.models.items()}
+            }
+
+
+class RemoteModel(ModelManager):
+    # صورة محلية عن نسخة موديل عايشة بسيرفر الـ inference (حالة بس، بدون أوزان)
+    def __init__(self, status):
+        super().__init__(model_path=status["model_path"], version=status["model_version"],
+                         backend=status["backend"])
+        self.update(status)
+
+    def update(self, status):
+        self._status = status
+        self.state = status["state"]
+        self.error = status["error"]
+        self.load_seconds = status["load_seconds"]
+        self.warmup_seconds = status["warmup_seconds"]
+        self.ready_at = status["ready_at"]
+        self.threading = status.get("threading")
+
+    def start(self):
+        pass
+
+    def status(self):
+        return self._status
+
+
+class RemoteModelRegistry(ModelRegistry):
+    """
+    نفس واجهة ModelRegistry للـ web workers، بس الموديلات بسيرفر الـ inference
+    (Controller/inference_server.py) اللي بيملك الأوزان ويجمع دفعات من كل الـ workers.
+    الحالة (active / candidate / split) بتنجاب من السيرفر كل status_ttl ثانية بـ thread بالخلفية،
+    فاختيار الموديل لكل طلب بيقرأ آخر نسخة محلية بس وما بيستنى السيرفر على الـ event loop،
+    والـ inference نفسه = رحلة وحدة للسيرفر لكل دفعة.
+    العمليات اللي بتروح للسيرفر (load / status / ...) blocking، فالـ routers بتناديها بـ threadpool.
+    """
+
+    def __init__(self, client, status_ttl=1.0):
+        super().__init__()
+        self.client = client
+        self.status_ttl = status_ttl
+        self._server_status = None
+        self._poller = None
+
+    def _refresh(self):
+        status = self.client.call("status")
+        with self._lock:
+            models = {}
+            for version, model_status in status["models"].items():
+                model = self.models.get(version)
+                if model is None:
+                    model = RemoteModel(model_status)
+                else:
+                    model.update(model_status)
+                models[version] = model
+            self.models = models
+            self.active_version = status["active_version"]
+            self.candidate_version = status["candidate_version"]
+            self.split_percent = status["split_percent"]
+            self.mode = status["mode"]
+            self._server_status = status
+
+    def _poll(self):
+        reachable = True
+        while True:
+            try:
+                self._refresh()
+                if not reachable:
+                    logger.info("AI inference server %s is reachable again", self.client.address)
+                reachable = True
+            except Exception as e:
+                if reachable:
+                    logger.warning("AI inference server %s is not reachable: %s", self.client.address, e)
+                reachable = False
+            time.sleep(self.status_ttl)
+
+    # ---------------- التحميل والتبديل (على السيرفر) ----------------
+    def _call(self, op, **kwargs):
+        result = self.client.call(op, **kwargs)
+        self._refresh()
+        return result
+
+    def load(self, version, model_path, backend=AI_BACKEND, tflite_path=TFLITE_MODEL_PATH,
+             activate=True, split_percent=0.0, mode="ab"):
+        return self._call("load", version=version, model_path=model_path, backend=backend,
+                          tflite_path=tflite_path, activate=activate, split_percent=split_percent, mode=mode)
+
+    def activate(self, version):
+        return self._call("activate", version=version)
+
+    def set_traffic(self, candidate_version, split_percent, mode="ab"):
+        return self._call("set_traffic", candidate_version=candidate_version,
+                          split_percent=split_percent, mode=mode)
+
+    def unload(self, version):
+        return self._call("unload", version=version)
+
+    def start(self):
+        # السيرفر هو اللي بيحمّل الموديل؛ هون بس بنتابع حالته. لحد أول رد
+        # ما في موديلات محلياً، فالطلبات بترجع 503 "قيد التحميل"
+        if self._poller is None:
+            self._poller = threading.Thread(target=self._poll, name="ai-inference-status", daemon=True)
+            self._poller.start()
+
+    def predict_and_explain_batch(self, items):
+        # الدفعة كاملة برحلة وحدة؛ السيرفر بيدمجها مع دفعات باقي الـ workers
+        return self.client.call(
+            "predict",
+            items=[(manager.version, x, explain, tta, known, priority)
+                   for manager, x, explain, tta, known, priority in items]
+        )
+
+    def status(self):
+        self._refresh()
+        status = dict(self._server_status)
+        status["client"] = self.client.stats()
+        return status
+
+
+def create_model_registry():
+    if not AI_INFERENCE_SERVER:
+        return ModelRegistry()
+
+    from Controller.inference_client import InferenceClient
+    client = InferenceClient(AI_INFERENCE_SERVER, AI_INFERENCE_AUTHKEY, timeout=AI_INFERENCE_TIMEOUT)
+    return RemoteModelRegistry(client)
+
+
+model_registry = create_model_registry()
@@ -0,0 +1,73 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from core.ai_config import (
+    AI_OOD_MAX_ASPECT,
+    AI_OOD_MAX_BRIGHT_FRACTION,
+    AI_OOD_MAX_COLORFULNESS,
+    AI_OOD_MIN_DARK_FRACTION,
+    AI_OOD_MIN_SIDE,
+)
+
+
+# النسخة المصغّرة اللي بتنحسب عليها الإحصائيات؛ JPEG بيتفك مباشرة بهاد الحجم (draft)
+OOD_THUMBNAIL_SIZE = 128
+DARK_LEVEL = 0.08
+BRIGHT_LEVEL = 0.9
+
+
+def image_statistics(data):
+    """
+    إحصائيات رخيصة على الصورة بدون ما نفكها بالحجم الكامل:
+    - colorfulness: متوسط فرق القنوات (الماموجرام رمادية تماماً ≈ 0)
+    - dark_fraction: نسبة الخلفية السودا حوالين الثدي
+    - bright_fraction: نسبة البكسلات البيضا (مستندات، screenshots)
+    - aspect: الضلع الطويل / القصير من أبعاد الصورة الأصلية
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        img.draft("RGB", (OOD_THUMBNAIL_SIZE, OOD_THUMBNAIL_SIZE))
+        img = img.convert("RGB")
+        img.thumbnail((OOD_THUMBNAIL_SIZE, OOD_THUMBNAIL_SIZE), Image.NEAREST)
+        pixels = np.asarray(img, dtype=np.float32) / 255.0
+
+    luminance = pixels.mean(axis=-1)
+    colorfulness = (
+        np.abs(pixels[..., 0] - pixels[..., 1]).mean() + np.abs(pixels[..., 1] - pixels[..., 2]).mean()
+    ) / 2
+
+    return {
+        "width": width,
+        "height": height,
+        "aspect": round(max(width, height) / max(1, min(width, height)), 3),
+        "colorfulness": round(float(colorfulness), 4),
+        "dark_fraction": round(float((luminance < DARK_LEVEL).mean()), 4),
+        "bright_fraction": round(float((luminance > BRIGHT_LEVEL).mean()), 4),
+        "mean_luminance": round(float(luminance.mean()), 4)
+    }
+
+
+def rejection_reasons(stats):
+    reasons = []
+    if min(stats["width"], stats["height"]) < AI_OOD_MIN_SIDE:
+        reasons.append("too_small")
+    if stats["aspect"] > AI_OOD_MAX_ASPECT:
+        reasons.append("aspect_ratio")
+    if stats["colorfulness"] > AI_OOD_MAX_COLORFULNESS:
+        reasons.append("color_image")
+    if stats["bright_fraction"] > AI_OOD_MAX_BRIGHT_FRACTION:
+        reasons.append("bright_background")
+    if stats["dark_fraction"] < AI_OOD_MIN_DARK_FRACTION:
+        reasons.append("no_dark_background")
+    return reasons
+
+
+def screen_image(data):
+    # ترجع (reasons, stats)؛ reasons فاضية = الصورة بتكمل للموديل
+    try:
+        stats = image_statistics(data)
+    except Exception:
+        return ["unreadable"], None
+    return rejection_reasons(stats), stats
@@ -0,0 +1,145 @@
+import hashlib
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+from Controller.similarity_index import unpack_embedding
+
+
+logger = logging.getLogger(__name__)
+
+
+def image_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _result_size(result):
+    size = 256
+    for value in result.values():
+        if isinstance(value, (str, bytes)):
+            size += len(value)
+        elif hasattr(value, "nbytes"):
+            size += value.nbytes
+    return size
+
+
+def pack_heatmap_grid(heatmap_grid):
+    # الـ heatmap الأصلي صغير (دقة آخر conv)، بنخزنه uint8 بدل صور PNG كاملة
+    grid = np.asarray(heatmap_grid, dtype=np.float32)
+    return {
+        "heatmap_grid": np.round(np.clip(grid, 0, 1) * 255).astype(np.uint8).tobytes(),
+        "shape": list(grid.shape)
+    }
+
+
+def unpack_heatmap_grid(packed):
+    grid = np.frombuffer(packed["heatmap_grid"], dtype=np.uint8).reshape(packed["shape"])
+    return grid.astype(np.float32) / 255.0
+
+
+class PredictionCache:
+    """
+    كاش للنتائج حسب SHA-256 للصورة + نسخة الموديل.
+    مستويين: LRU بالذاكرة محدود بعدد العناصر والحجم، وبعده بحث في predictions_collection
+    عن سجل قديم لنفس الصورة ونفس الموديل. الـ hit ما بيلمس TensorFlow أبداً.
+    """
+
+    def __init__(self, collection, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.collection = collection
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("image_sha256", 1), ("model_version", 1)])
+
+    async def get(self, image_hash, model_version, require_explanation=True):
+        key = (image_hash, model_version)
+        entry = self._entries.get(key)
+        if entry is not None and (not require_explanation or entry[0].get("heatmap_grid") is not None):
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return dict(entry[0])
+
+        result = await self._find_in_db(image_hash, model_version, require_explanation)
+        if result is not None:
+            self.db_hits += 1
+            self.put(image_hash, model_version, result)
+            return dict(result)
+
+        self.misses += 1
+        return None
+
+    async def _find_in_db(self, image_hash, model_version, require_explanation):
+        # السجلات اللي احتمالاتها من TTA مش نتيجة التمريرة العادية
+        query = {"image_sha256": image_hash, "model_version": model_version, "tta_views": {"$exists": False}}
+        if require_explanation:
+            query["explanation.heatmap_grid"] = {"$exists": True}
+
+        try:
+            record = await self.collection.find_one(
+                query,
+                {"_id": 0, "prediction": 1, "probabilities": 1, "last_conv_layer": 1, "explanation": 1, "embedding": 1},
+                sort=[("uploaded_at", -1)]
+            )
+        except Exception as e:
+            # الكاش ما لازم يوقف الطلب، نكمل كـ miss
+            logger.warning("Prediction cache lookup failed: %s", e)
+            return None
+
+        if not record:
+            return None
+
+        explanation = record.get("explanation") or {}
+        return {
+            "pred_label": record["prediction"],
+            "probs": record["probabilities"],
+            "heatmap_grid": unpack_heatmap_grid(explanation) if "heatmap_grid" in explanation else None,
+            "embedding": unpack_embedding(record["embedding"]) if "embedding" in record else None,
+            "last_conv": record.get("last_conv_layer"),
+            "model_version": model_version
+        }
+
+    def put(self, image_hash, model_version, result):
+        key = (image_hash, model_version)
+        existing = self._entries.get(key)
+        if existing is not None and result.get("heatmap_grid") is None and existing[0].get("heatmap_grid") is not None:
+            # ما نستبدل نتيجة فيها شرح بنتيجة بدونه
+            return
+
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+
+        self._entries[key] = (dict(result), size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,104 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+
+# الحقول المسموح ترجع بقائمة السجلات؛ الثقيلة (explanation / shadow) ما بتطلع بالقائمة أبداً
+RECORD_FIELDS = (
+    "filename", "image_sha256", "model_version", "uploaded_at", "uploaded_by", "uploader_role",
+    "prediction", "confidence", "probabilities", "last_conv_layer", "regions",
+    "findings", "recommendations", "explanation_status", "tta_views"
+)
+DEFAULT_RECORD_FIELDS = (
+    "filename", "model_version", "uploaded_at", "uploaded_by", "prediction", "confidence", "explanation_status"
+)
+
+# الترتيب دايماً (uploaded_at, _id) تنازلي، وكل index بيخلص بنفس الترتيب
+# عشان الفلتر + الـ sort + الـ keyset يمشوا على index واحد بدون sort بالذاكرة
+HISTORY_INDEXES = [
+    [("uploaded_at", -1), ("_id", -1)],
+    [("prediction", 1), ("uploaded_at", -1), ("_id", -1)],
+    [("uploaded_by", 1), ("uploaded_at", -1), ("_id", -1)],
+]
+
+
+async def ensure_history_indexes(collection):
+    for keys in HISTORY_INDEXES:
+        await collection.create_index(keys)
+
+
+def encode_cursor(record):
+    raw = json.dumps({"t": record["uploaded_at"].isoformat(), "id": str(record["_id"])})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(raw["t"]), ObjectId(raw["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields):
+    if not fields:
+        return DEFAULT_RECORD_FIELDS
+    requested = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in requested if f not in RECORD_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+def build_history_query(label=None, min_confidence=None, max_confidence=None,
+                        date_from=None, date_to=None, uploaded_by=None, cursor=None):
+    query = {}
+    if label:
+        query["prediction"] = label
+    if uploaded_by:
+        query["uploaded_by"] = uploaded_by
+
+    confidence = {}
+    if min_confidence is not None:
+        confidence["$gte"] = min_confidence
+    if max_confidence is not None:
+        confidence["$lte"] = max_confidence
+    if confidence:
+        query["confidence"] = confidence
+
+    uploaded_at = {}
+    if date_from is not None:
+        uploaded_at["$gte"] = date_from
+    if date_to is not None:
+        uploaded_at["$lt"] = date_to
+    if uploaded_at:
+        query["uploaded_at"] = uploaded_at
+
+    if cursor:
+        # keyset: كل اللي قبل آخر سجل بالصفحة السابقة حسب (uploaded_at, _id)
+        last_time, last_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"uploaded_at": {"$lt": last_time}},
+            {"uploaded_at": last_time, "_id": {"$lt": last_id}},
+        ]
+    return query
+
+
+async def find_history(collection, query, fields, limit):
+    projection = {field: 1 for field in fields}
+    projection["uploaded_at"] = 1
+
+    cursor = collection.find(query, projection).sort([("uploaded_at", -1), ("_id", -1)]).limit(limit + 1)
+    records = await cursor.to_list(length=limit + 1)
+
+    next_cursor = encode_cursor(records[limit - 1]) if len(records) > limit else None
+    records = records[:limit]
+
+    for record in records:
+        record["id"] = str(record.pop("_id"))
+        if "uploaded_at" not in fields:
+            record.pop("uploaded_at", None)
+    return records, next_cursor
@@ -0,0 +1,235 @@
+import logging
+import threading
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+
+logger = logging.getLogger(__name__)
+
+
+def pack_embedding(embedding):
+    # L2-normalized float16: 2.5KB لـ 1280 بُعد، والـ cosine بيصير dot product
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    vector /= np.linalg.norm(vector) + 1e-12
+    return {"vector": vector.astype(np.float16).tobytes(), "dim": int(vector.shape[0])}
+
+
+def unpack_embedding(packed):
+    return np.frombuffer(packed["vector"], dtype=np.float16).astype(np.float32)
+
+
+def _vector(embedding):
+    # float16 بس لتخزين Mongo؛ الفهرس بالذاكرة float32
+    if isinstance(embedding, dict):
+        return unpack_embedding(embedding)
+    return np.asarray(embedding, dtype=np.float32).ravel()
+
+
+class _HnswIndex:
+    # فهرس تقريبي اختياري (hnswlib) للأحجام الكبيرة جداً
+    def __init__(self, dim, capacity):
+        import hnswlib
+
+        self.index = hnswlib.Index(space="ip", dim=dim)
+        self.index.init_index(max_elements=capacity, ef_construction=200, M=16)
+        self.index.set_ef(64)
+
+    def add(self, vectors, rows):
+        needed = int(rows.max()) + 1
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+        self.index.add_items(vectors, rows)
+
+    def search(self, vector, k):
+        k = min(k, self.index.get_current_count())
+        labels, distances = self.index.knn_query(vector[None, :], k=k)
+        # space="ip" بيرجع 1 - dot
+        return labels[0], 1.0 - distances[0]
+
+
+class EmbeddingIndex:
+    """
+    فهرس الحالات السابقة لنسخة موديل وحدة (الـ embeddings من نسخ مختلفة مش قابلة للمقارنة).
+    brute-force: مصفوفة float32 مطبّعة بتكبر بالمضاعفة إذا ما انعرف الحجم من قبل، والبحث =
+    matmul وحدة + argpartition. الـ float16 بس لتخزين Mongo: تحويله لـ float32 مع كل بحث
+    أبطأ بكتير من الـ matmul نفسه (~1.5 ثانية مقابل ~136ms على 300k×1280)، فالذاكرة ضعف
+    (~1.5GB لـ 300k×1280)؛ للأحجام الأكبر backend="hnsw".
+    backend="hnsw": نفس الواجهة عبر hnswlib إذا كان منزّل، وإلا بنرجع للـ brute-force.
+    """
+
+    def __init__(self, dim, backend="brute", initial_capacity=1024):
+        self.dim = dim
+        self.ids = []
+        self._rows = {}
+        self._matrix = np.zeros((max(1, initial_capacity), dim), dtype=np.float32)
+        self._lock = threading.Lock()
+
+        self._ann = None
+        if backend == "hnsw":
+            try:
+                self._ann = _HnswIndex(dim, max(1, initial_capacity))
+            except ImportError:
+                logger.warning("hnswlib is not installed, using brute-force similarity search")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_many(self, ids, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            fresh = [i for i, record_id in enumerate(ids) if record_id not in self._rows]
+            if not fresh:
+                return
+            ids = [ids[i] for i in fresh]
+            vectors = vectors[fresh]
+
+            start = len(self.ids)
+            end = start + len(ids)
+            if end > self._matrix.shape[0]:
+                # نسخة جديدة أكبر؛ البحث الشغال بيكمّل على المرجع القديم
+                grown = np.zeros((max(end, 2 * self._matrix.shape[0]), self.dim), dtype=np.float32)
+                grown[:start] = self._matrix[:start]
+                self._matrix = grown
+
+            self._matrix[start:end] = vectors
+            for offset, record_id in enumerate(ids):
+                self._rows[record_id] = start + offset
+            self.ids.extend(ids)
+
+            if self._ann is not None:
+                self._ann.add(vectors, np.arange(start, end))
+
+    def add(self, record_id, vector):
+        self.add_many([record_id], [vector])
+
+    def vector(self, record_id):
+        with self._lock:
+            row = self._rows.get(record_id)
+            return None if row is None else self._matrix[row].copy()
+
+    def search(self, vector, k, exclude=None):
+        # ترجع [(record_id, similarity), ...] من الأقرب للأبعد
+        with self._lock:
+            matrix, count, ids = self._matrix, len(self.ids), self.ids
+        if count == 0:
+            return []
+
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        wanted = k + (1 if exclude is not None else 0)
+
+        if self._ann is not None:
+            rows, scores = self._ann.search(vector, wanted)
+        else:
+            scores = matrix[:count] @ vector
+            if wanted < count:
+                rows = np.argpartition(-scores, wanted - 1)[:wanted]
+            else:
+                rows = np.arange(count)
+            rows = rows[np.argsort(-scores[rows], kind="stable")]
+            scores = scores[rows]
+
+        results = []
+        for row, score in zip(rows, scores):
+            record_id = ids[int(row)]
+            if record_id == exclude:
+                continue
+            results.append((record_id, float(score)))
+        return results[:k]
+
+    def stats(self):
+        return {
+            "entries": len(self.ids),
+            "dim": self.dim,
+            "capacity": int(self._matrix.shape[0]),
+            "backend": "hnsw" if self._ann is not None else "brute",
+            "bytes": int(self._matrix.nbytes)
+        }
+
+
+class SimilarityIndex:
+    """
+    فهرس لكل نسخة موديل، بينبني من predictions_collection بالخلفية عند التشغيل
+    وبيتحدّث مع كل تنبؤ جديد.
+    الإضافة والنسخ على المصفوفة بتصير بـ threadpool، والحجم بينعرف من Mongo قبل التحميل
+    فالمصفوفة بتنحجز مرة وحدة بدل ما تتضاعف وتنسخ أثناء التحميل.
+    """
+
+    def __init__(self, collection, backend="brute", load_batch_size=5000, headroom=1024):
+        self.collection = collection
+        self.backend = backend
+        self.load_batch_size = load_batch_size
+        self.headroom = headroom
+        self.indexes = {}
+        self.capacities = {}
+        self.state = "not_loaded"  # not_loaded -> loading -> ready | failed
+        self._lock = threading.Lock()
+
+    def _index_for(self, model_version, dim):
+        with self._lock:
+            index = self.indexes.get(model_version)
+            if index is None:
+                capacity = self.capacities.get(model_version, 0) + self.headroom
+                index = EmbeddingIndex(dim, backend=self.backend, initial_capacity=capacity)
+                self.indexes[model_version] = index
+            return index
+
+    def add(self, record_id, model_version, embedding):
+        # بتنسخ على المصفوفة، فمن الـ router بتنادى بـ run_in_threadpool
+        vector = _vector(embedding)
+        self._index_for(model_version, vector.shape[0]).add(str(record_id), vector)
+
+    async def _count_by_version(self):
+        pipeline = [
+            {"$match": {"embedding": {"$exists": True}}},
+            {"$group": {"_id": "$model_version", "count": {"$sum": 1}}}
+        ]
+        counts = await self.collection.aggregate(pipeline).to_list(None)
+        return {entry["_id"]: entry["count"] for entry in counts}
+
+    async def load(self):
+        self.state = "loading"
+        try:
+            self.capacities = await self._count_by_version()
+            cursor = self.collection.find(
+                {"embedding": {"$exists": True}},
+                {"_id": 1, "model_version": 1, "embedding": 1}
+            ).batch_size(self.load_batch_size)
+
+            pending = {}
+            async for record in cursor:
+                batch = pending.setdefault(record["model_version"], ([], []))
+                batch[0].append(str(record["_id"]))
+                batch[1].append(_vector(record["embedding"]))
+                if len(batch[0]) >= self.load_batch_size:
+                    await run_in_threadpool(self._flush, record["model_version"], batch)
+                    pending.pop(record["model_version"])
+            for model_version, batch in pending.items():
+                await run_in_threadpool(self._flush, model_version, batch)
+
+            self.state = "ready"
+            logger.info("Similarity index loaded: %s", {v: len(i) for v, i in self.indexes.items()})
+        except Exception:
+            self.state = "failed"
+            logger.exception("Similarity index failed to load")
+
+    def _flush(self, model_version, batch):
+        ids, vectors = batch
+        self._index_for(model_version, vectors[0].shape[0]).add_many(ids, np.stack(vectors))
+
+    def search(self, record_id, model_version, k, vector=None):
+        index = self.indexes.get(model_version)
+        if index is None:
+            return []
+        if vector is None:
+            vector = index.vector(str(record_id))
+        if vector is None:
+            return []
+        return index.search(vector, k, exclude=str(record_id))
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "backend": self.backend,
+            "indexes": {version: index.stats() for version, index in self.indexes.items()}
+        }
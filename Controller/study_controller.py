@@ -0,0 +1,67 @@
+import re
+
+
+# ================== دراسة ماموجرام متعددة المناظر ==================
+# الدراسة العادية 4 صور: يمين/يسار × CC/MLO
+STANDARD_VIEWS = ["L-CC", "L-MLO", "R-CC", "R-MLO"]
+
+# ترتيب الخطورة لاختيار نتيجة الدراسة: أي منظر malignant بيخلي الدراسة malignant
+SEVERITY = ["malignant", "benign", "normal"]
+
+_VIEW_PATTERN = re.compile(r"^(?:(L|R|LEFT|RIGHT)[\s_-]*)?(CC|MLO)$")
+
+
+def normalize_view(label):
+    # "lcc" / "L_CC" / "left mlo" -> "L-CC" / "L-MLO"، وأي اسم ثاني بيرجع زي ما هو
+    label = (label or "").strip()
+    match = _VIEW_PATTERN.match(label.upper())
+    if not match:
+        return label
+    side, projection = match.groups()
+    if side is None:
+        return projection
+    return f"{side[0]}-{projection}"
+
+
+def view_side(view):
+    if view[:2] in ("L-", "R-"):
+        return view[0]
+    return None
+
+
+def _combine(views):
+    # متوسط الاحتمالات للمناظر، والتصنيف حسب الأخطر بينها
+    probs = [sum(p) / len(views) for p in zip(*(v["probabilities"] for v in views))]
+    worst = min(views, key=lambda v: SEVERITY.index(v["prediction"]) if v["prediction"] in SEVERITY else len(SEVERITY))
+    return {
+        "prediction": worst["prediction"],
+        "confidence": max(v["confidence"] for v in views if v["prediction"] == worst["prediction"]),
+        "probabilities": probs,
+        "views": [v["view"] for v in views]
+    }
+
+
+def aggregate_study(views, class_names):
+    """
+    views: [{"view", "prediction", "confidence", "probabilities", "valid"}, ...]
+    بترجع نتيجة على مستوى الدراسة + لكل جهة (L / R) من المناظر المقبولة فقط.
+    """
+    valid = [v for v in views if v["valid"]]
+    if not valid:
+        return None
+
+    aggregate = _combine(valid)
+    if "malignant" in class_names:
+        index = class_names.index("malignant")
+        aggregate["max_malignant_probability"] = max(v["probabilities"][index] for v in valid)
+
+    sides = {}
+    for side in ("L", "R"):
+        side_views = [v for v in valid if view_side(v["view"]) == side]
+        if side_views:
+            sides[side] = _combine(side_views)
+    aggregate["sides"] = sides
+
+    aggregate["missing_views"] = [view for view in STANDARD_VIEWS if view not in {v["view"] for v in views}]
+    aggregate["rejected_views"] = [v["view"] for v in views if not v["valid"]]
+    return aggregate
@@ -0,0 +1,87 @@
+# ai_config.py
+# إعدادات الـ AI اللي بتنقرأ بدون ما نستورد TensorFlow
+import json
+import os
+
+# ---------------- الموديل ----------------
+MODEL_PATH = os.getenv("AI_MODEL_PATH", "efficientnetv2l_mammography_3class.h5")
+
+# "keras" = الـ .h5 كما هو، "tflite" = نسخة مكمّمة (scripts/convert_tflite.py)
+# الـ tflite بس للتنبؤ بدون شرح (explain=False)؛ الشرح بيحتاج gradients فبيمرق على
+# تمريرة Keras الموحّدة، والاحتمالات بتطلع منها عشان تطابق الـ heatmap
+AI_BACKEND = os.getenv("AI_BACKEND", "keras")
+TFLITE_MODEL_PATH = os.getenv("AI_TFLITE_PATH", "efficientnetv2l_mammography_3class_int8.tflite")
+
+MODEL_VERSION = os.getenv("AI_MODEL_VERSION", os.path.splitext(os.path.basename(MODEL_PATH))[0])
+if AI_BACKEND != "keras":
+    # نتائج الـ backend المكمّم مختلفة شوي، فما بتشارك الكاش مع الـ .h5
+    MODEL_VERSION = f"{MODEL_VERSION}+{AI_BACKEND}"
+
+# ---------------- بروفايل الـ threads (scripts/autotune_threads.py) ----------------
+# أفضل intra/inter-op threads و oneDNN وحجم الدفعة لهالجهاز؛ متغيرات البيئة دايماً بتغلب عليه
+AI_THREAD_PROFILE_PATH = os.getenv("AI_THREAD_PROFILE", "ai_thread_profile.json")
+
+
+def load_thread_profile(path=AI_THREAD_PROFILE_PATH):
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+AI_THREAD_PROFILE = load_thread_profile()
+if "onednn" in AI_THREAD_PROFILE:
+    # لازم ينضبط قبل ما TensorFlow ينستورد، وهاد الملف بينقرأ قبله
+    os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "1" if AI_THREAD_PROFILE["onednn"] else "0")
+
+# ---------------- التنفيذ ----------------
+# أكبر دفعة بتنبني إلها signature ثابتة، ونفس الرقم بيستخدمه الـ batcher
+AI_MAX_BATCH_SIZE = int(os.getenv("AI_MAX_BATCH_SIZE", str(AI_THREAD_PROFILE.get("batch_size", 8))))
+AI_JIT_COMPILE = os.getenv("AI_JIT_COMPILE", "1") == "1"
+
+# أحجام دفعات ثابتة (buckets): كل دفعة بتتعبّى بصفوف فاضية لأصغر bucket بيكفيها،
+# فعدد الأشكال (XLA signatures / TFLite interpreters) محدود ومعروف من البداية
+AI_BATCH_BUCKETS = sorted(
+    {size for size in (1, 2, 4, 8, 16, 32, 64) if size < AI_MAX_BATCH_SIZE} | {AI_MAX_BATCH_SIZE}
+)
+
+# أحجام الدفعات اللي بنسخّن عليها الموديل بعد التحميل (الافتراضي: كل الـ buckets)
+AI_WARMUP_BATCH_SIZES = [
+    int(size) for size in os.getenv("AI_WARMUP_BATCH_SIZES", ",".join(map(str, AI_BATCH_BUCKETS))).split(",")
+    if size.strip()
+]
+
+# ---------------- سيرفر الـ inference المشترك ----------------
+# فاضي = الموديل داخل نفس الـ worker (زي قبل). غير هيك = عنوان Controller/inference_server.py
+# (مسار Unix socket أو host:port) وكل الـ workers بيبعتوا للموديل الوحيد اللي هناك
+AI_INFERENCE_SERVER = os.getenv("AI_INFERENCE_SERVER", "")
+# multiprocessing.connection بيعمل unpickle لكل اللي بيوصله، فالمفتاح سر مشترك إجباري
+# (بدون قيمة افتراضية) والسيرفر والعميل ما بيشتغلوا بدونه
+AI_INFERENCE_AUTHKEY = os.getenv("AI_INFERENCE_AUTHKEY", "").encode("utf-8")
+AI_INFERENCE_TIMEOUT = float(os.getenv("AI_INFERENCE_TIMEOUT", "120"))
+
+# ---------------- Test-time augmentation ----------------
+# off | on | auto (auto = بس لما أعلى احتمال داخل AI_TTA_BAND)، والطلب بيقدر يغيّرها بـ ?tta=
+AI_TTA_MODE = os.getenv("AI_TTA_MODE", "off")
+AI_TTA_BAND = tuple(float(v) for v in os.getenv("AI_TTA_BAND", "0.6,0.8").split(","))
+# إزاحة أفقية بالبكسل لنسخ الـ shift (على صورة 456×456)
+AI_TTA_SHIFT = int(os.getenv("AI_TTA_SHIFT", "16"))
+
+# ---------------- مناطق الشرح (boxes) ----------------
+# على شبكة الـ Grad-CAM الأصلية: الخلايا فوق الحد بتتجمع لمناطق، والمنطقة
+# الأصغر من AI_REGION_MIN_AREA (نسبة من الشبكة) بتنشال
+AI_REGION_THRESHOLD = float(os.getenv("AI_REGION_THRESHOLD", "0.8"))
+AI_REGION_MIN_AREA = float(os.getenv("AI_REGION_MIN_AREA", "0.001"))
+AI_REGION_MAX = int(os.getenv("AI_REGION_MAX", "5"))
+
+# ---------------- فلتر الصور الغريبة (قبل الموديل) ----------------
+# إحصائيات رخيصة على نسخة مصغّرة: الصورة اللي بتفشل بأي قاعدة بتترفض بدون forward
+AI_OOD_FILTER = os.getenv("AI_OOD_FILTER", "on")
+AI_OOD_MAX_COLORFULNESS = float(os.getenv("AI_OOD_MAX_COLORFULNESS", "0.03"))
+AI_OOD_MAX_BRIGHT_FRACTION = float(os.getenv("AI_OOD_MAX_BRIGHT_FRACTION", "0.25"))
+AI_OOD_MIN_DARK_FRACTION = float(os.getenv("AI_OOD_MIN_DARK_FRACTION", "0.05"))
+AI_OOD_MAX_ASPECT = float(os.getenv("AI_OOD_MAX_ASPECT", "2.0"))
+AI_OOD_MIN_SIDE = int(os.getenv("AI_OOD_MIN_SIDE", "128"))
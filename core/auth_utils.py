@@ -1,5 +1,7 @@
 # auth_utils.py
-from fastapi import HTTPException
+from typing import Optional
+
+from fastapi import Header, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 
@@ -47,3 +49,42 @@ def get_doctor_id_from_token(token: str):
 #         return doctor_id
 #     except JWTError:
 #         raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def _user_from_authorization(authorization):
+    # None لو ما في توكن، أو التوكن غلط / منتهي
+    if not authorization:
+        return None
+
+    token = authorization[7:] if authorization.startswith("Bearer ") else authorization
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+    # توكن الأدمن ما فيه id (بس sub و role = admin). توكن بدون role بياخد أقل صلاحية،
+    # فما في توكن بيصير أدمن إلا إذا انكتب فيه صراحة
+    user_id = payload.get("id") or payload.get("sub")
+    if not user_id:
+        return None
+    return {"id": str(user_id), "role": payload.get("role") or "anonymous"}
+
+
+def get_optional_user(authorization: Optional[str] = Header(None)):
+    """
+    هوية صاحب الطلب من الـ JWT بدون استعلام على قاعدة البيانات، للمسارات المفتوحة
+    (زي الـ AI) اللي بدها تعرف مين رفع الصورة إذا كان مسجّل دخول.
+    بدون header أو بتوكن غلط / منتهي بترجع None (مجهول): المسار مفتوح، فتوكن قديم
+    بالتطبيق ما لازم يرفض طلب كان رح ينقبل بدونه.
+    """
+    return _user_from_authorization(authorization)
+
+
+def get_required_user(authorization: Optional[str] = Header(None)):
+    """
+    نفس get_optional_user بس للمسارات اللي بدها تسجيل دخول: بدون توكن صالح 401.
+    """
+    user = _user_from_authorization(authorization)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+    return user
@@ -0,0 +1,85 @@
+# metrics.py
+# Prometheus metrics للـ AI + توقيت المراحل لكل طلب (Server-Timing)
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# ---------------- Histograms ----------------
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+AI_STAGE_SECONDS = Histogram(
+    "ai_stage_seconds",
+    "Time spent in each stage of an AI request",
+    ["endpoint", "stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+AI_REQUEST_SECONDS = Histogram(
+    "ai_request_seconds",
+    "Total handler time of AI requests",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS
+)
+
+# ---------------- فلتر الصور الغريبة ----------------
+# نسبة الرفض = rejected / (accepted + rejected)، و reason = أول قاعدة رفضت الصورة
+AI_OOD_DECISIONS = Counter(
+    "ai_ood_decisions_total",
+    "Uploads screened by the out-of-distribution pre-filter",
+    ["endpoint", "decision", "reason"]
+)
+
+# ---------------- Admission control ----------------
+AI_QUEUE_DEPTH = Gauge("ai_queue_depth", "AI inference requests waiting in the queue")
+AI_INFLIGHT_REQUESTS = Gauge("ai_inflight_requests", "AI requests admitted and not finished", ["role"])
+AI_ADMISSION_REJECTIONS = Counter(
+    "ai_admission_rejections_total",
+    "AI requests rejected before queueing",
+    ["endpoint", "role", "reason"]
+)
+
+
+def metrics_payload():
+    # (body, content_type) لـ /metrics
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class StageTimer:
+    """
+    مدة كل مرحلة بطلب واحد: بتنسجل بالـ histogram وبتطلع بالـ Server-Timing header.
+    perf_counter + observe بس، فرخيصة كفاية تضل شغالة دايماً.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        AI_STAGE_SECONDS.labels(self.endpoint, stage).observe(seconds)
+
+    @contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def finish(self):
+        total = time.perf_counter() - self.started
+        AI_REQUEST_SECONDS.labels(self.endpoint).observe(total)
+        return total
+
+    def server_timing(self, total=None):
+        parts = [f"{stage};dur={1000 * seconds:.1f}" for stage, seconds in self.stages.items()]
+        if total is not None:
+            parts.append(f"total;dur={1000 * total:.1f}")
+        return ", ".join(parts)
+
+    def apply(self, response):
+        # response = Response المرجعة أو الـ Response المحقونة بالـ endpoint
+        response.headers["Server-Timing"] = self.server_timing(self.finish())
+        return response
@@ -0,0 +1,127 @@
+# uploads.py
+# رفع الملفات بأجزاء (chunks): فحص النوع من أول bytes، حد أقصى للحجم لكل endpoint،
+# و SHA-256 أثناء القراءة. الكتابة على الديسك والـ hashing بيصيروا برا الـ event loop.
+import hashlib
+import os
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# ---------------- حدود الحجم لكل نوع رفع ----------------
+MB = 1024 * 1024
+AI_UPLOAD_MAX_BYTES = int(float(os.getenv("AI_UPLOAD_MAX_MB", "25")) * MB)
+CV_UPLOAD_MAX_BYTES = int(float(os.getenv("CV_UPLOAD_MAX_MB", "10")) * MB)
+PROFILE_IMAGE_MAX_BYTES = int(float(os.getenv("PROFILE_IMAGE_MAX_MB", "5")) * MB)
+
+# ---------------- أنواع الملفات حسب الـ magic bytes ----------------
+FILE_EXTENSIONS = {"jpeg": "jpg", "png": "png", "webp": "webp", "gif": "gif", "bmp": "bmp", "pdf": "pdf"}
+IMAGE_KINDS = ("jpeg", "png", "webp")
+# الـ CV كان بيقبل أي image/*، فـ GIF و BMP مسموحين هون كمان
+CV_KINDS = IMAGE_KINDS + ("gif", "bmp", "pdf")
+
+
+def detect_kind(head):
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:2] == b"BM" and head[6:10] == b"\x00\x00\x00\x00":
+        # الـ "BM" لحاله قصير، فكمان الـ reserved bytes بالـ header لازم يكونوا صفر
+        return "bmp"
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    return None
+
+
+class StoredUpload:
+    def __init__(self, filename, kind, size, sha256, path=None, data=None):
+        self.filename = filename
+        self.kind = kind
+        self.size = size
+        self.sha256 = sha256
+        self.path = path
+        self.data = data
+
+    @property
+    def extension(self):
+        return FILE_EXTENSIONS[self.kind]
+
+
+def _too_large(max_bytes):
+    return HTTPException(status_code=413, detail=f"الملف أكبر من الحد المسموح ({max_bytes // MB} MB)")
+
+
+def _write_chunk(f, hasher, chunk):
+    hasher.update(chunk)
+    f.write(chunk)
+
+
+def _discard(f, path):
+    f.close()
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def stream_upload(file: UploadFile, allowed_kinds, max_bytes, dest_path=None, keep_bytes=False):
+    """
+    بتقرأ الملف chunk بعد chunk:
+    - النوع بيتحدد من أول chunk (مش من الامتداد أو content-type) وبيترفض فوراً إذا مش مسموح
+    - الحجم بينفحص مع كل chunk، فالملف الكبير بيترفض قبل ما ينقرأ كامل
+    - dest_path: بيتكتب على الديسك (ملف .part وبعدين rename)، و "{ext}" بالمسار بيتبدّل بامتداد النوع
+    - keep_bytes: للمسارات اللي بتحتاج الـ bytes بالذاكرة (الـ AI)
+    """
+    size = getattr(file, "size", None)
+    if size is not None and size > max_bytes:
+        raise _too_large(max_bytes)
+
+    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    kind = detect_kind(chunk[:16])
+    if kind not in allowed_kinds:
+        allowed = ", ".join(FILE_EXTENSIONS[k].upper() for k in allowed_kinds)
+        raise HTTPException(status_code=400, detail=f"صيغة الملف غير مدعومة. المسموح: {allowed}")
+
+    hasher = hashlib.sha256()
+    chunks = [] if keep_bytes else None
+    f = part_path = None
+    if dest_path is not None:
+        dest_path = dest_path.replace("{ext}", FILE_EXTENSIONS[kind])
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        part_path = dest_path + ".part"
+        f = await run_in_threadpool(open, part_path, "wb")
+
+    total = 0
+    try:
+        while chunk:
+            total += len(chunk)
+            if total > max_bytes:
+                raise _too_large(max_bytes)
+            if f is not None:
+                await run_in_threadpool(_write_chunk, f, hasher, chunk)
+            else:
+                await run_in_threadpool(hasher.update, chunk)
+            if chunks is not None:
+                chunks.append(chunk)
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        if f is not None:
+            await run_in_threadpool(_discard, f, part_path)
+        raise
+
+    if f is not None:
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(os.replace, part_path, dest_path)
+
+    return StoredUpload(
+        filename=file.filename,
+        kind=kind,
+        size=total,
+        sha256=hasher.hexdigest(),
+        path=dest_path,
+        data=b"".join(chunks) if chunks is not None else None
+    )
@@ -20,6 +20,8 @@ try:
     otp_collection = mongo_db["otp_storage"]
     predictions_collection = mongo_db["predictions"]
     medical_records_collection = mongo_db["medical_records"]
+    studies_collection = mongo_db["studies"]
+    explanation_links_collection = mongo_db["explanation_links"]
 
     # مؤقتاً
     temp_patients_collection = mongo_db["temp_patients"]
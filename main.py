@@ -1,17 +1,20 @@
 # main.py
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image as keras_image
-import numpy as np
-from tensorflow.keras.applications.efficientnet_v2 import preprocess_input as preprocess_efficientnet_v2
 from datetime import datetime, timedelta
+import asyncio
 import logging
 import os
 from Controller.appointment_controller import send_daily_doctor_notifications
 from Controller.patient_controller import patient_controller 
+from Controller.model_manager import model_registry
 from fastapi import FastAPI, File, UploadFile
+from fastapi.responses import JSONResponse, Response
+from core.metrics import metrics_payload
+from Controller.prediction_history import ensure_history_indexes
+from database import predictions_collection
 from fastapi.staticfiles import StaticFiles
 # Routers
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 import pytz  
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from routers import ai_router, chat_router, patient_router 
@@ -28,6 +31,18 @@ app = FastAPI()
 def read_root():
     return {"message": "🚀 Server is running with auto-reload!"}
 
+# جاهزية السيرفر: الموديل محمّل ومسخّن
+@app.get("/health/ready")
+def health_ready():
+    status = model_registry.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+# Prometheus: توزيع زمن مراحل طلبات الـ AI
+@app.get("/metrics")
+def metrics():
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
 # =============== Include Routers ===============
 app.include_router(patient_router.router)
 app.include_router(dector_router.router)
@@ -47,7 +62,18 @@ logging.basicConfig(level=logging.INFO)
 
 @app.on_event("startup")
 async def startup_event():
+    # تحميل موديل الـ AI بالخلفية، باقي المسارات شغالة من هلأ
+    model_registry.start()
+
     await patient_controller.startup_event()
+    await ai_router.prediction_cache.ensure_indexes()
+    await ai_router.explanation_store.ensure_indexes()
+    await ai_router.explanation_jobs.ensure_indexes()
+    # سجلات شرح مؤجل ضلت pending من تشغيل سابق
+    await ai_router.explanation_jobs.fail_stale()
+    await ensure_history_indexes(predictions_collection)
+    # فهرس الحالات المشابهة بيتبني من السجلات بالخلفية
+    app.state.similarity_loader = asyncio.create_task(ai_router.similarity_index.load())
     
     scheduler = AsyncIOScheduler(timezone=pytz.timezone("Asia/Amman"))
     
@@ -57,6 +83,9 @@ async def startup_event():
         trigger=CronTrigger(hour=13, minute=0, day_of_week='mon-thu,sat')
     )
     
+    # الشرح المؤجل اللي انقطع (restart لـ worker تاني) بيتعلّم failed بدل ما يضل pending
+    scheduler.add_job(ai_router.explanation_jobs.fail_stale, trigger=IntervalTrigger(minutes=5))
+
     scheduler.start()
     print(f"✅ تم تشغيل Scheduler وسيتم إرسال الإيميل الساعة 18:00")
     
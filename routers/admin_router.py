@@ -4,6 +4,9 @@ from fastapi.security import OAuth2PasswordBearer
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, EmailStr
 from Controller.admin_controller import admin_controller 
+from Controller.model_manager import model_registry
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
 from jose import jwt, JWTError
 from database import patients_collection
 
@@ -16,6 +19,20 @@ class AdminLoginModel(BaseModel):
     email: EmailStr
     password: str
 
+class LoadAIModelRequest(BaseModel):
+    version: str
+    model_path: str
+    backend: str = "keras"
+    tflite_path: Optional[str] = None
+    activate: bool = True
+    split_percent: float = 0.0
+    mode: str = "ab"
+
+class AITrafficRequest(BaseModel):
+    candidate_version: Optional[str] = None
+    split_percent: float = 0.0
+    mode: str = "ab"
+
 # ----------------- Router -----------------
 router = APIRouter(prefix="/admin", tags=["Admin"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/admin/login")
@@ -108,3 +125,47 @@ async def logout_admin(current_admin=Depends(get_current_admin)):
     تسجيل الخروج: ببساطة يُعلم العميل أن يسجل الخروج
     """
     return {"message": "Logged out successfully"}
+
+
+
+# ---------------- نسخ موديل الـ AI ----------------
+@router.get("/ai/models")
+async def list_ai_models(current_admin=Depends(get_current_admin)):
+    return await run_in_threadpool(model_registry.status)
+
+
+@router.post("/ai/models")
+async def load_ai_model(request: LoadAIModelRequest, current_admin=Depends(get_current_admin)):
+    """
+    تحميل نسخة جديدة بالخلفية وتسخينها، وبعدها:
+    activate=true يحوّل كل الطلبات إلها، وإلا split_percent من الطلبات (ab أو shadow)
+    """
+    # مع سيرفر inference مشترك كل العمليات هون رحلة blocking للسيرفر، فبرا الـ event loop
+    kwargs = {"tflite_path": request.tflite_path} if request.tflite_path else {}
+    return await run_in_threadpool(
+        model_registry.load,
+        request.version,
+        request.model_path,
+        backend=request.backend,
+        activate=request.activate,
+        split_percent=request.split_percent,
+        mode=request.mode,
+        **kwargs
+    )
+
+
+@router.post("/ai/models/{version}/activate")
+async def activate_ai_model(version: str, current_admin=Depends(get_current_admin)):
+    return await run_in_threadpool(model_registry.activate, version)
+
+
+@router.put("/ai/traffic")
+async def set_ai_traffic(request: AITrafficRequest, current_admin=Depends(get_current_admin)):
+    return await run_in_threadpool(
+        model_registry.set_traffic, request.candidate_version, request.split_percent, request.mode
+    )
+
+
+@router.delete("/ai/models/{version}")
+async def unload_ai_model(version: str, current_admin=Depends(get_current_admin)):
+    return await run_in_threadpool(model_registry.unload, version)
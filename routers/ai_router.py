@@ -1,72 +1,473 @@
 from pyexpat import model
-from fastapi import APIRouter, UploadFile, File
-import shutil
-from tensorflow.keras.models import load_model
-import os
-from Controller.ai_controller import predict_and_explain
+from fastapi import APIRouter, UploadFile, File, Form
+from typing import List, Optional
+import logging
 import os
+from core.ai_config import AI_INFERENCE_SERVER, AI_MAX_BATCH_SIZE, AI_OOD_FILTER, AI_TTA_BAND, AI_TTA_MODE, MODEL_VERSION
+from Controller.inference_batcher import InferenceBatcher
+from Controller.admission import BACKGROUND_PRIORITY, AdmissionController
+from Controller.model_manager import model_registry
+from Controller.prediction_cache import PredictionCache, pack_heatmap_grid
+from Controller.explanation_store import ExplanationStore
+from Controller.explanation_jobs import ExplanationJobs
+from Controller.image_ops import CLASS_NAMES, decode_image_bytes, encode_image, find_regions, render_explanation
+from Controller.similarity_index import SimilarityIndex, pack_embedding, unpack_embedding
+from bson import ObjectId
+from fastapi.responses import StreamingResponse
+import asyncio
+import time
+from core.metrics import AI_OOD_DECISIONS, AI_QUEUE_DEPTH, StageTimer
+from core.uploads import AI_UPLOAD_MAX_BYTES, FILE_EXTENSIONS, IMAGE_KINDS, detect_kind, stream_upload
+from starlette.concurrency import run_in_threadpool
 import base64
 import cv2
 import numpy as np
 from datetime import datetime
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from tensorflow.keras.models import load_model
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Depends, Query, Response
+from fastapi.encoders import jsonable_encoder
+import json
+import secrets
 from PIL import Image
 
-from database import predictions_collection
+from database import explanation_links_collection, predictions_collection, studies_collection
+from Controller.study_controller import aggregate_study, normalize_view
+from Controller.ood_filter import screen_image
+from Controller.prediction_history import build_history_query, find_history, parse_fields
+from core.auth_utils import get_optional_user, get_required_user
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
-UPLOAD_DIR = "uploads\image_Ai"
+UPLOAD_DIR = os.path.join("uploads", "image_Ai")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# حفظ الصورة الأصلية صار خطوة اختيارية بالخلفية بعد الرد
+AI_PERSIST_UPLOADS = os.getenv("AI_PERSIST_UPLOADS", "1") == "1"
 
 
 
-MODEL_PATH = "efficientnetv2l_mammography_3class.h5"
-ai_model = load_model(MODEL_PATH)
-print("✅ AI model loaded successfully")
 
+# نسخ الموديل بتتحمّل بالخلفية عند الـ startup (main.py) مش وقت الـ import
+# وبتتبدّل من /admin/ai/models بدون إعادة تشغيل
 
+# تجميع الطلبات المتزامنة في دفعة واحدة على نفس الموديل
+# مع سيرفر inference مشترك التجميع بيصير هناك، فالـ worker ما بيستنى قبل ما يبعت
+AI_MAX_WAIT_MS = float(os.getenv("AI_MAX_WAIT_MS", "0" if AI_INFERENCE_SERVER else "15"))
+AI_MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "64"))
 
-@router.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+# الموديل يشتغل على thread واحد خاص فيه، مش على الـ event loop
+ai_batcher = InferenceBatcher(
+    model_registry.predict_and_explain_batch,
+    max_batch_size=AI_MAX_BATCH_SIZE,
+    max_wait_ms=AI_MAX_WAIT_MS,
+    max_queue=AI_MAX_QUEUE
+)
+AI_QUEUE_DEPTH.set_function(ai_batcher.queue_depth)
+
+# قبول الطلبات: أولوية حسب الدور، حد لكل مستخدم، ورفض سريع لما الانتظار المتوقع يطول
+ai_admission = AdmissionController(
+    ai_batcher,
+    per_user_limit=int(os.getenv("AI_PER_USER_LIMIT", "2")),
+    deadline_seconds=float(os.getenv("AI_QUEUE_DEADLINE_SECONDS", "20"))
+)
+
+# كاش النتائج حسب hash الصورة (نفس الصورة بترجع بدون TensorFlow)
+prediction_cache = PredictionCache(
+    predictions_collection,
+    max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("AI_CACHE_MAX_MB", "64")) * 1024 * 1024
+)
+
+# روابط صور الشرح (explain=url)
+explanation_store = ExplanationStore(
+    explanation_links_collection,
+    ttl_seconds=int(os.getenv("AI_EXPLANATION_URL_TTL", "300")),
+    max_bytes=int(os.getenv("AI_EXPLANATION_CACHE_MB", "32")) * 1024 * 1024
+)
+
+# الحالات المشابهة: embeddings بالذاكرة لكل نسخة موديل، بتتحمّل بالخلفية عند الـ startup
+similarity_index = SimilarityIndex(
+    predictions_collection,
+    backend=os.getenv("AI_SIMILARITY_BACKEND", "brute")
+)
+
+# الشرح المؤجل (mode=async في /momo)
+explanation_jobs = ExplanationJobs(
+    predictions_collection,
+    timeout_seconds=int(os.getenv("AI_EXPLANATION_JOB_TIMEOUT", "300"))
+)
+AI_SSE_TIMEOUT_SECONDS = int(os.getenv("AI_SSE_TIMEOUT", "60"))
+
+
+def upload_path(image_hash, data):
+    # الاسم = sha256 + امتداد النوع الحقيقي: ملفين بنفس اسم العميل (image.jpg) ما بيدعسوا على بعض،
+    # ونفس الصورة بتنحفظ مرة وحدة. اسم العميل بيضل بالسجل (filename) كـ metadata بس
+    return os.path.join(UPLOAD_DIR, f"{image_hash}.{FILE_EXTENSIONS[detect_kind(data[:16])]}")
+
+
+def save_upload(image_hash, data):
+    return write_upload(upload_path(image_hash, data), data)
+
+
+def write_upload(file_path, data):
+    if os.path.exists(file_path):
+        return file_path
+    tmp_path = f"{file_path}.{secrets.token_hex(4)}.part"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+def schedule_save_upload(background_tasks, image_hash, data):
+    # ترجع مسار الصورة اللي رح تنحفظ، أو None إذا الحفظ مطفي
+    if not AI_PERSIST_UPLOADS:
+        return None
+    background_tasks.add_task(save_upload, image_hash, data)
+    return upload_path(image_hash, data)
+
+
+async def read_image_upload(file):
+    # ترجع (bytes, sha256): النوع والحجم بينفحصوا أثناء القراءة والـ hash بينحسب معها
+    upload = await stream_upload(file, IMAGE_KINDS, AI_UPLOAD_MAX_BYTES, keep_bytes=True)
+    return upload.data, upload.sha256
+
+
+async def decode_upload(data, timer=None):
+    # فك الصورة مرة وحدة بالذاكرة بدون ما نكتبها على الديسك
+    started = time.perf_counter()
+    decoded = await run_in_threadpool(decode_image_bytes, data)
+    if timer is not None:
+        timer.add("decode", time.perf_counter() - started)
+    return decoded
+
+
+async def screen_upload(data, timer):
+    # فلتر رخيص قبل الموديل: ترجع أسباب الرفض (فاضية = مقبولة)
+    if AI_OOD_FILTER == "off":
+        return []
+    with timer.stage("ood"):
+        reasons, _ = await run_in_threadpool(screen_image, data)
+    # صورة وحدة = عدّة وحدة، بأول قاعدة رفضتها
+    AI_OOD_DECISIONS.labels(timer.endpoint, "rejected" if reasons else "accepted", reasons[0] if reasons else "").inc()
+    return reasons
+
+
+def ood_rejection(reasons):
+    return HTTPException(
+        status_code=400,
+        detail=f"الصورة لا تبدو ماموجرام ({', '.join(reasons)})"
+    )
+
+
+async def run_inference(manager, x, explain=True, tta=False, timer=None, priority=BACKGROUND_PRIORITY, known=None):
+    # known = نتيجة سابقة لنفس الصورة (شوف ai_controller.predict_and_explain_batch)
+    # الأولوية جوا العنصر كمان، عشان سيرفر الـ inference المشترك يرتّب فيها طابوره.
+    # InferenceQueueFull بتطلع زي ما هي: ai_admission.admit بتحوّلها لـ 503 وبتعدّها
+    started = time.perf_counter()
+    result = await ai_batcher.submit((manager, x, explain, tta, known, priority), priority)
+
+    # مراحل الموديل من thread الـ inference، والباقي من الزمن انتظار بالطابور
+    timings = result.pop("timings", {})
+    if timer is not None:
+        elapsed = time.perf_counter() - started
+        timer.add("queue", max(0.0, elapsed - sum(timings.values())))
+        for stage, seconds in timings.items():
+            timer.add(stage, seconds)
+    return result
+
+
+# ================== Test-time augmentation ==================
+# off: بدون | on: دايماً | auto: بس للحالات الحدّية (أعلى احتمال داخل AI_TTA_BAND)
+TTA_MODES = ("off", "on", "auto")
+
+
+def check_tta_mode(tta):
+    if tta not in TTA_MODES:
+        raise HTTPException(status_code=400, detail=f"tta must be one of {', '.join(TTA_MODES)}")
+
+
+def needs_tta(result, tta):
+    if tta == "on":
+        return True
+    if tta == "auto":
+        low, high = AI_TTA_BAND
+        return low <= max(result["probs"]) < high
+    return False
+
+
+async def run_inference_cached(data, image_hash, explain=True, tta="off", timer=None, priority=BACKGROUND_PRIORITY):
+    # ترجع (النتيجة، الصورة المصغّرة أو None لو من الكاش، موديل shadow أو None)
+    # نتائج الـ TTA ما بتنحفظ بالكاش، الكاش دايماً للتمريرة العادية
+    try:
+        manager, shadow = model_registry.choose()
+    except HTTPException:
+        # لسا الموديل بيتحمّل: الكاش بيقدر يخدم الصور المعروفة
+        version = model_registry.active_version or MODEL_VERSION
+        result = await cache_lookup(image_hash, version, explain, timer)
+        if result is None:
+            raise
+        return result, None, None
+
+    result, orig, x = None, None, None
+    if tta != "on":
+        result = await cache_lookup(image_hash, manager.version, explain, timer)
+        if result is None:
+            orig, x = await decode_upload(data, timer)
+            result = await run_inference(manager, x, explain, timer=timer, priority=priority)
+            prediction_cache.put(image_hash, manager.version, result)
+
+    if result is None or needs_tta(result, tta):
+        if x is None:
+            orig, x = await decode_upload(data, timer)
+        # التمريرة العادية (من الموديل أو الكاش) بتنعاد استخدامها: بس النسخ المعدّلة بتمرق forward
+        result = await run_inference(manager, x, explain, tta=True, timer=timer, priority=priority, known=result)
+    return result, orig, shadow
 
-    result = predict_and_explain(ai_model, file_path)
+
+async def cache_lookup(image_hash, model_version, explain, timer=None):
+    started = time.perf_counter()
+    result = await prediction_cache.get(image_hash, model_version, require_explanation=explain)
+    if timer is not None:
+        timer.add("cache", time.perf_counter() - started)
     return result
 
 
+async def run_shadow(manager, data, record_id):
+    # مقارنة النسخة الجديدة على نفس الصورة بدون ما تأثر على الرد
+    try:
+        _, x = await decode_upload(data)
+        result = await run_inference(manager, x, explain=False)
+    except Exception as e:
+        logging.warning("Shadow inference on %s failed: %s", manager.version, e)
+        return
+
+    await predictions_collection.update_one(
+        {"_id": record_id},
+        {"$set": {"shadow": {
+            "model_version": manager.version,
+            "prediction": result["pred_label"],
+            "confidence": max(result["probs"]),
+            "probabilities": result["probs"]
+        }}}
+    )
+
+
+async def run_explanation_job(record_id, model_version, data, image_hash, probs, tta=False):
+    # Grad-CAM بالخلفية على نفس نسخة الموديل اللي طلع منها التنبؤ وعلى نفس الكلاس
+    # (probs المرجعة للعميل، حتى لو من TTA)، فما في forward جديد للنسخ
+    try:
+        manager = model_registry.models.get(model_version)
+        if manager is None or not manager.ready:
+            raise RuntimeError(f"Model version {model_version} is no longer loaded")
+
+        _, x = await decode_upload(data)
+        result = await asyncio.wait_for(
+            run_inference(manager, x, explain=True, known={"probs": probs}), explanation_jobs.timeout_seconds
+        )
+    except Exception as e:
+        await predictions_collection.update_one(
+            {"_id": record_id},
+            {"$set": {"explanation_status": "failed", "explanation_error": str(e) or type(e).__name__}}
+        )
+        raise
+
+    if not tta:
+        prediction_cache.put(image_hash, model_version, result)
+    await predictions_collection.update_one(
+        {"_id": record_id},
+        {"$set": {
+            "explanation": pack_heatmap_grid(result["heatmap_grid"]),
+            "regions": explanation_regions(result["heatmap_grid"]),
+            "explanation_status": "ready",
+            "explained_at": datetime.utcnow()
+        }}
+    )
+
+
+# ================== صيغ الشرح (overlay / heatmap) ==================
+# none: بدون صور | inline: base64 داخل الـ JSON | url: روابط قصيرة العمر بترسم عند أول طلب
+# multipart: رد multipart/mixed فيه الـ JSON والصورتين binary
+EXPLAIN_MODES = ("none", "inline", "url", "multipart")
+
+
+def check_explain_options(explain, image_format):
+    if explain not in EXPLAIN_MODES:
+        raise HTTPException(status_code=400, detail=f"explain must be one of {', '.join(EXPLAIN_MODES)}")
+    if image_format not in ("png", "jpeg", "webp"):
+        raise HTTPException(status_code=400, detail="image_format must be png, jpeg or webp")
+
+
+def explanation_regions(heatmap_grid):
+    # على الشبكة الصغيرة مباشرة، فرخيصة كفاية نحسبها لكل رد
+    return find_regions(heatmap_grid)
+
+
+async def explanation_response(payload, result, orig, data, explain, image_format, quality, image_path=None):
+    if result.get("heatmap_grid") is None:
+        return payload
+    payload["regions"] = explanation_regions(result["heatmap_grid"])
+    if explain == "none":
+        return payload
+
+    if explain == "url":
+        # الرابط بيرجع للصورة المحفوظة، فبنكتبها هلأ بدل ما نستنى الـ background task
+        # (العميل ممكن يفتح الرابط قبل ما تخلص)؛ الـ task بعدين بيلاقيها وبيتخطاها
+        if image_path:
+            if data is not None:
+                await run_in_threadpool(write_upload, image_path, data)
+            token = await explanation_store.put(result["heatmap_grid"], image_path=image_path)
+        else:
+            if orig is None:
+                orig, _ = await decode_upload(data)
+            display_png = await run_in_threadpool(encode_image, orig, "png")
+            token = await explanation_store.put(result["heatmap_grid"], display_png=display_png)
+        query = f"image_format={image_format}&quality={quality}"
+        payload["overlay_url"] = f"{router.prefix}/explanations/{token}/overlay?{query}"
+        payload["heatmap_url"] = f"{router.prefix}/explanations/{token}/heatmap?{query}"
+        payload["expires_in"] = explanation_store.ttl_seconds
+        return payload
+
+    if orig is None:
+        orig, _ = await decode_upload(data)
+    rendered = await run_in_threadpool(render_explanation, orig, result["heatmap_grid"], image_format, quality)
+
+    if explain == "multipart":
+        return multipart_response(payload, rendered)
+
+    payload["overlay"] = base64.b64encode(rendered["overlay"]).decode("utf-8")
+    payload["heatmap"] = base64.b64encode(rendered["heatmap"]).decode("utf-8")
+    payload["image_format"] = image_format
+    return payload
+
+
+def with_server_timing(body, response, timer):
+    # multipart بيرجع Response جاهزة، وغير هيك الـ header بينحط على الـ Response المحقونة
+    timer.apply(body if isinstance(body, Response) else response)
+    return body
+
+
+def multipart_response(payload, rendered):
+    boundary = secrets.token_hex(16)
+    parts = [
+        ("application/json", "result", json.dumps(jsonable_encoder(payload)).encode("utf-8")),
+        (rendered["media_type"], "overlay", rendered["overlay"]),
+        (rendered["media_type"], "heatmap", rendered["heatmap"]),
+    ]
+
+    body = b""
+    for content_type, name, content in parts:
+        body += (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Disposition: inline; name=\"{name}\"\r\n\r\n"
+        ).encode("utf-8") + content + b"\r\n"
+    body += f"--{boundary}--\r\n".encode("utf-8")
+
+    return Response(content=body, media_type=f"multipart/mixed; boundary={boundary}")
+
+
+
+@router.post("/predict")
+async def predict(
+    background_tasks: BackgroundTasks,
+    response: Response,
+    file: UploadFile = File(...),
+    explain: str = Query("inline"),
+    image_format: str = Query("png"),
+    quality: int = Query(85, ge=1, le=100),
+    tta: str = Query(AI_TTA_MODE),
+    user=Depends(get_optional_user)
+):
+    check_explain_options(explain, image_format)
+    check_tta_mode(tta)
+    timer = StageTimer("predict")
+    with timer.stage("read"):
+        data, image_hash = await read_image_upload(file)
+
+    try:
+        async with ai_admission.admit(user, timer.endpoint) as priority:
+            result, orig, shadow = await run_inference_cached(
+                data, image_hash, explain=explain != "none", tta=tta, timer=timer, priority=priority
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"خطأ أثناء تشغيل النموذج: {str(e)}")
+
+    image_path = schedule_save_upload(background_tasks, image_hash, data)
+
+    payload = {
+        "pred_label": result["pred_label"],
+        "probs": result["probs"],
+        "last_conv": result["last_conv"],
+        "model_version": result["model_version"]
+    }
+    if "tta_views" in result:
+        payload["tta_views"] = result["tta_views"]
+    with timer.stage("render"):
+        body = await explanation_response(
+            payload, result, orig, data, explain, image_format, quality, image_path=image_path
+        )
+    return with_server_timing(body, response, timer)
+
+
 
 
 @router.post("/momo")
-async def predict(file: UploadFile = File(...)):
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
+async def predict(
+    background_tasks: BackgroundTasks,
+    response: Response,
+    file: UploadFile = File(...),
+    mode: str = Query("sync"),
+    explain: str = Query("none"),
+    image_format: str = Query("png"),
+    quality: int = Query(85, ge=1, le=100),
+    tta: str = Query(AI_TTA_MODE),
+    user=Depends(get_optional_user)
+):
+    """
+    mode=sync: التنبؤ والشرح مع بعض (زي قبل)
+    mode=async: التنبؤ بيرجع بعد الـ forward مباشرة، والـ Grad-CAM بيتحسب بالخلفية
+    وبيتجاب من /ai/predictions/{id}/explanation أو /ai/predictions/{id}/explanation/events
+    """
+    if mode not in ("sync", "async"):
+        raise HTTPException(status_code=400, detail="mode must be sync or async")
+    check_explain_options(explain, image_format)
+    check_tta_mode(tta)
+    timer = StageTimer("momo")
+    with timer.stage("read"):
+        data, image_hash = await read_image_upload(file)
 
-    # حفظ الصورة
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    # الصور الواضح إنها مش ماموجرام (سيلفي، مستندات، screenshots) بتترفض قبل الموديل
+    reasons = await screen_upload(data, timer)
+    if reasons:
+        raise ood_rejection(reasons)
 
     # تشغيل النموذج
     try:
-        result = predict_and_explain(ai_model, file_path)  # ⚠ دالة عادية
+        async with ai_admission.admit(user, timer.endpoint) as priority:
+            result, orig, shadow = await run_inference_cached(
+                data, image_hash, explain=mode == "sync", tta=tta, timer=timer, priority=priority
+            )
+    except HTTPException:
+        raise
     except Exception as e:
-        os.remove(file_path)
         raise HTTPException(status_code=400, detail=f"خطأ أثناء تشغيل النموذج: {str(e)}")
 
     # فحص الثقة
     confidence = max(result["probs"])
     if confidence < 0.6:
-        os.remove(file_path)
         raise HTTPException(status_code=400, detail="النموذج غير واثق أن الصورة ماموجرام صالحة")
 
     
     # حفظ النتيجة في MongoDB
     record = {
         "filename": file.filename,
+        "image_sha256": image_hash,
+        "model_version": result["model_version"],
         "uploaded_at": datetime.utcnow(),
+        "uploaded_by": user["id"] if user else None,
+        "uploader_role": user["role"] if user else None,
         "prediction": result["pred_label"],
         "confidence": confidence,
         "probabilities": result["probs"],
@@ -75,21 +476,444 @@ async def predict(file: UploadFile = File(...)):
         "recommendations": result.get("recommendations", [])
     }
 
+    explained = result.get("heatmap_grid") is not None
+    if explained:
+        record["explanation"] = pack_heatmap_grid(result["heatmap_grid"])
+        record["regions"] = explanation_regions(result["heatmap_grid"])
+    record["explanation_status"] = "ready" if explained else "pending"
+    if "tta_views" in result:
+        record["tta_views"] = result["tta_views"]
+    if result.get("embedding") is not None:
+        record["embedding"] = pack_embedding(result["embedding"])
+
+    # حفظ الصورة فقط إذا كانت ماموجرام مقبولة
+    image_path = schedule_save_upload(background_tasks, image_hash, data)
+    if image_path:
+        record["image_path"] = image_path
+
     # لو تستخدم Motor (async)
-    inserted = await predictions_collection.insert_one(record)  
+    with timer.stage("db_insert"):
+        inserted = await predictions_collection.insert_one(record)
 
-    return {
+    if "embedding" in record:
+        await run_in_threadpool(
+            similarity_index.add, inserted.inserted_id, record["model_version"], record["embedding"]
+        )
+
+    if not explained:
+        explanation_jobs.start(
+            str(inserted.inserted_id),
+            run_explanation_job(
+                inserted.inserted_id, result["model_version"], data, image_hash, result["probs"],
+                tta="tta_views" in result
+            )
+        )
+
+    if shadow is not None:
+        background_tasks.add_task(run_shadow, shadow, data, inserted.inserted_id)
+
+    payload = {
         "id": str(inserted.inserted_id),  # ✅ تحويل ObjectId إلى string
+        "model_version": result["model_version"],
         "prediction": result["pred_label"],
         "confidence": confidence,
         "probabilities": result["probs"],
         "findings": result.get("findings", []),
-        "recommendations": result.get("recommendations", [])
+        "recommendations": result.get("recommendations", []),
+        "explanation_status": record["explanation_status"],
+        "explanation_url": f"{router.prefix}/predictions/{inserted.inserted_id}/explanation"
+    }
+    if "tta_views" in result:
+        payload["tta_views"] = result["tta_views"]
+    with timer.stage("render"):
+        body = await explanation_response(
+            payload, result, orig, data, explain, image_format, quality, image_path=image_path
+        )
+    return with_server_timing(body, response, timer)
+
+
+# ================== دراسة كاملة (CC/MLO لكل جهة) ==================
+AI_STUDY_MAX_VIEWS = int(os.getenv("AI_STUDY_MAX_VIEWS", "8"))
+
+
+async def run_study_inference(datas, hashes, priority=BACKGROUND_PRIORITY):
+    # كل مناظر الدراسة على نفس نسخة الموديل، والصور اللي مش بالكاش
+    # بتنفك مع بعض وبتنبعت للطابور مرة وحدة فبتطلع بنفس الدفعة
+    manager, _ = model_registry.choose()
+    results = list(await asyncio.gather(*(prediction_cache.get(h, manager.version) for h in hashes)))
+    origs = [None] * len(datas)
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    decoded = await asyncio.gather(*(decode_upload(datas[i]) for i in missing))
+    computed = await asyncio.gather(*(run_inference(manager, x, True, priority=priority) for _, x in decoded))
+
+    for i, (orig, _), result in zip(missing, decoded, computed):
+        prediction_cache.put(hashes[i], manager.version, result)
+        results[i] = result
+        origs[i] = orig
+    return results, origs
+
+
+@router.post("/study")
+async def predict_study(
+    background_tasks: BackgroundTasks,
+    response: Response,
+    files: List[UploadFile] = File(...),
+    views: Optional[List[str]] = Form(None),
+    explain: str = Query("none"),
+    image_format: str = Query("png"),
+    quality: int = Query(85, ge=1, le=100),
+    user=Depends(get_optional_user)
+):
+    """
+    دراسة ماموجرام بطلب multipart واحد: files = الصور، views = اسم كل منظر
+    بنفس الترتيب (L-CC, L-MLO, R-CC, R-MLO). بترجع نتيجة كل منظر + نتيجة الدراسة،
+    وبتنحفظ كسجل واحد في studies_collection.
+    """
+    check_explain_options(explain, image_format)
+    if views and len(views) == 1 and "," in views[0]:
+        views = views[0].split(",")
+    if explain == "multipart":
+        raise HTTPException(status_code=400, detail="explain=multipart is not supported for studies")
+    if len(files) > AI_STUDY_MAX_VIEWS:
+        raise HTTPException(status_code=400, detail=f"A study can have at most {AI_STUDY_MAX_VIEWS} images")
+    if views and len(views) != len(files):
+        raise HTTPException(status_code=400, detail="views must have one label per file")
+
+    labels = [normalize_view(v) for v in views] if views else [f.filename for f in files]
+    if len(set(labels)) != len(labels):
+        raise HTTPException(status_code=400, detail="Duplicate view labels in study")
+
+    timer = StageTimer("study")
+    with timer.stage("read"):
+        uploads = await asyncio.gather(*(read_image_upload(f) for f in files))
+        datas = [data for data, _ in uploads]
+        hashes = [image_hash for _, image_hash in uploads]
+
+    # المناظر اللي بيرفضها الفلتر ما بتدخل الموديل وبتطلع valid=False
+    screened = await asyncio.gather(*(screen_upload(data, timer) for data in datas))
+    accepted = [i for i, reasons in enumerate(screened) if not reasons]
+    if not accepted:
+        raise ood_rejection(sorted({reason for reasons in screened for reason in reasons}))
+
+    try:
+        # المناظر بتشتغل بالتوازي، فهون بنقيس المرحلة كاملة مش كل منظر
+        async with ai_admission.admit(user, timer.endpoint, items=len(accepted)) as priority:
+            with timer.stage("inference"):
+                computed, computed_origs = await run_study_inference(
+                    [datas[i] for i in accepted], [hashes[i] for i in accepted], priority
+                )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"خطأ أثناء تشغيل النموذج: {str(e)}")
+
+    results, origs = [None] * len(datas), [None] * len(datas)
+    for i, result, orig in zip(accepted, computed, computed_origs):
+        results[i], origs[i] = result, orig
+
+    view_records = []
+    for label, file, data, image_hash, result, reasons in zip(labels, files, datas, hashes, results, screened):
+        if result is None:
+            view_records.append({
+                "view": label,
+                "filename": file.filename,
+                "image_sha256": image_hash,
+                "valid": False,
+                "rejected_reasons": reasons
+            })
+            continue
+
+        confidence = max(result["probs"])
+        view_record = {
+            "view": label,
+            "filename": file.filename,
+            "image_sha256": image_hash,
+            "prediction": result["pred_label"],
+            "confidence": confidence,
+            "probabilities": result["probs"],
+            "last_conv_layer": result["last_conv"],
+            "explanation": pack_heatmap_grid(result["heatmap_grid"]),
+            "regions": explanation_regions(result["heatmap_grid"]),
+            # نفس شرط /momo: الصورة اللي النموذج مش واثق فيها ما بتدخل بنتيجة الدراسة
+            "valid": confidence >= 0.6
+        }
+        if view_record["valid"]:
+            image_path = schedule_save_upload(background_tasks, image_hash, data)
+            if image_path:
+                view_record["image_path"] = image_path
+        view_records.append(view_record)
+
+    aggregate = aggregate_study(view_records, CLASS_NAMES)
+    if aggregate is None:
+        raise HTTPException(status_code=400, detail="النموذج غير واثق أن صور الدراسة ماموجرام صالحة")
+
+    record = {
+        "model_version": computed[0]["model_version"],
+        "uploaded_at": datetime.utcnow(),
+        "uploaded_by": user["id"] if user else None,
+        "uploader_role": user["role"] if user else None,
+        "views": view_records,
+        "aggregate": aggregate
     }
+    with timer.stage("db_insert"):
+        inserted = await studies_collection.insert_one(record)
+
+    view_payloads = []
+    with timer.stage("render"):
+        for view_record, result, orig, data in zip(view_records, results, origs, datas):
+            view_payload = {
+                key: view_record[key]
+                for key in ("view", "filename", "prediction", "confidence", "probabilities", "valid", "rejected_reasons")
+                if key in view_record
+            }
+            if view_record["valid"]:
+                view_payload = await explanation_response(
+                    view_payload, result, orig, data, explain, image_format, quality,
+                    image_path=view_record.get("image_path")
+                )
+            view_payloads.append(view_payload)
+
+    timer.apply(response)
+    return {
+        "id": str(inserted.inserted_id),
+        "model_version": record["model_version"],
+        "aggregate": aggregate,
+        "views": view_payloads
+    }
+
+
+# ================== روابط صور الشرح ==================
+@router.get("/explanations/{token}/{kind}")
+async def get_explanation_image(
+    token: str,
+    kind: str,
+    image_format: str = Query("png"),
+    quality: int = Query(85, ge=1, le=100)
+):
+    if kind not in ("overlay", "heatmap"):
+        raise HTTPException(status_code=404, detail="Not found")
+    check_explain_options("url", image_format)
+
+    rendered = await explanation_store.render(
+        token, kind, image_format, quality, render_explanation, lambda data: decode_image_bytes(data)[0]
+    )
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="انتهت صلاحية الرابط")
+
+    content, media_type = rendered
+    return Response(content=content, media_type=media_type, headers={"Cache-Control": f"private, max-age={explanation_store.ttl_seconds}"})
+
+# ================== الشرح المؤجل ==================
+async def find_prediction(prediction_id, projection=None):
+    try:
+        obj_id = ObjectId(prediction_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid prediction id")
+
+    record = await predictions_collection.find_one(
+        {"_id": obj_id},
+        projection or {"explanation": 1, "explanation_status": 1, "explanation_error": 1, "image_path": 1}
+    )
+    if not record:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    return record
+
+
+def explanation_status(record):
+    if "explanation_status" in record:
+        return record["explanation_status"]
+    return "ready" if "heatmap_grid" in (record.get("explanation") or {}) else "missing"
+
+
+def load_display_image(image_path):
+    with open(image_path, "rb") as f:
+        return decode_image_bytes(f.read())[0]
+
+
+async def prediction_explanation(prediction_id, record, explain, image_format, quality):
+    status = explanation_status(record)
+    payload = {"id": prediction_id, "status": status}
+    if status == "failed":
+        payload["error"] = record.get("explanation_error")
+    if status != "ready" or explain == "none":
+        return payload
+
+    from Controller.prediction_cache import unpack_heatmap_grid
+
+    result = {"heatmap_grid": unpack_heatmap_grid(record["explanation"])}
+    image_path = record.get("image_path")
+    if not image_path or not os.path.exists(image_path):
+        # الشرح نفسه جاهز، بس ما في صورة نرسم عليها (AI_PERSIST_UPLOADS=0 أو الملف انمسح)
+        payload["regions"] = explanation_regions(result["heatmap_grid"])
+        payload["images_available"] = False
+        payload["detail"] = "الصورة الأصلية غير محفوظة على السيرفر، متاح فقط مناطق الاشتباه"
+        return payload
+
+    orig = await run_in_threadpool(load_display_image, image_path)
+    return await explanation_response(
+        payload, result, orig, None, explain, image_format, quality, image_path=image_path
+    )
+
+
+@router.get("/predictions/{prediction_id}/explanation")
+async def get_prediction_explanation(
+    prediction_id: str,
+    explain: str = Query("inline"),
+    image_format: str = Query("png"),
+    quality: int = Query(85, ge=1, le=100)
+):
+    check_explain_options(explain, image_format)
+    record = await find_prediction(prediction_id)
+    return await prediction_explanation(prediction_id, record, explain, image_format, quality)
+
+
+@router.get("/predictions/{prediction_id}/explanation/events")
+async def stream_prediction_explanation(
+    prediction_id: str,
+    image_format: str = Query("png"),
+    quality: int = Query(85, ge=1, le=100)
+):
+    # Server-Sent Events: حدث واحد "explanation" لما الشرح يجهز (أو يفشل) فيه روابط الصور
+    check_explain_options("url", image_format)
+    await find_prediction(prediction_id)
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + AI_SSE_TIMEOUT_SECONDS
+        while True:
+            record = await find_prediction(prediction_id)
+            if explanation_status(record) != "pending":
+                try:
+                    payload = await prediction_explanation(prediction_id, record, "url", image_format, quality)
+                except HTTPException as e:
+                    payload = {"id": prediction_id, "status": explanation_status(record), "error": e.detail}
+                yield f"event: explanation\ndata: {json.dumps(jsonable_encoder(payload))}\n\n"
+                return
+
+            if loop.time() >= deadline:
+                yield f"event: timeout\ndata: {json.dumps({'id': prediction_id, 'status': 'pending'})}\n\n"
+                return
+
+            yield ": waiting\n\n"
+            await explanation_jobs.wait(prediction_id, 1.0)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# ================== حالات سابقة مشابهة ==================
+SIMILAR_CASE_FIELDS = {
+    "_id": 1, "filename": 1, "uploaded_at": 1, "prediction": 1, "confidence": 1,
+    "model_version": 1, "explanation_status": 1
+}
+
+
+def _rank_own_uploads(vector, records, k):
+    # البحث على صور صاحب الطلب بس؛ عددهم صغير فـ matmul مباشر بدون الفهرس
+    if not records:
+        return []
+    scores = np.stack([unpack_embedding(r["embedding"]) for r in records]) @ vector
+    order = np.argsort(-scores, kind="stable")[:k]
+    return [(str(records[i]["_id"]), float(scores[i])) for i in order]
+
+
+@router.get("/predictions/{prediction_id}/similar")
+async def get_similar_predictions(
+    prediction_id: str,
+    k: int = Query(10, ge=1, le=100),
+    user=Depends(get_required_user)
+):
+    """
+    أقرب k حالات سابقة (cosine على الـ embedding من نفس نسخة الموديل).
+    الدكتور والأدمن بيبحثوا بكل السجلات، وغيرهم بس بين الصور اللي رفعوها (متل /records).
+    """
+    restricted = user["role"] not in ("doctor", "admin")
+    record = await find_prediction(prediction_id, {"model_version": 1, "embedding": 1, "uploaded_by": 1})
+    if restricted and record.get("uploaded_by") != user["id"]:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    if "embedding" not in record:
+        raise HTTPException(status_code=404, detail="No embedding stored for this prediction")
+
+    # لو الفهرس لسا بيتحمّل والسجل مش فيه، بنبحث بالـ vector المخزن معه
+    vector = unpack_embedding(record["embedding"])
+    neighbours = {}
+    if restricted:
+        own = await predictions_collection.find(
+            {
+                "uploaded_by": user["id"], "model_version": record["model_version"],
+                "embedding": {"$exists": True}, "_id": {"$ne": record["_id"]}
+            },
+            {**SIMILAR_CASE_FIELDS, "embedding": 1}
+        ).to_list(None)
+        matches = await run_in_threadpool(_rank_own_uploads, vector, own, k)
+        for neighbour in own:
+            neighbour.pop("embedding")
+            neighbours[str(neighbour.pop("_id"))] = neighbour
+    else:
+        matches = await run_in_threadpool(
+            similarity_index.search, prediction_id, record["model_version"], k, vector
+        )
+        if matches:
+            cursor = predictions_collection.find(
+                {"_id": {"$in": [ObjectId(record_id) for record_id, _ in matches]}}, SIMILAR_CASE_FIELDS
+            )
+            async for neighbour in cursor:
+                neighbours[str(neighbour.pop("_id"))] = neighbour
+
+    similar = []
+    for record_id, score in matches:
+        if record_id in neighbours:
+            similar.append(dict(id=record_id, similarity=round(score, 4), **neighbours[record_id]))
+
+    return jsonable_encoder({
+        "id": prediction_id,
+        "model_version": record["model_version"],
+        "index_state": similarity_index.state,
+        "similar": similar
+    })
+
+
+# ================== حالة طابور الـ AI ==================
+@router.get("/queue")
+def get_queue_stats():
+    stats = ai_batcher.stats()
+    stats["admission"] = ai_admission.stats()
+    return stats
+
+@router.get("/cache")
+def get_cache_stats():
+    return prediction_cache.stats()
+
+@router.get("/similarity")
+def get_similarity_stats():
+    return similarity_index.stats()
 
 # ================== جلب السجلات ==================
 @router.get("/records")
-def get_records():
-    records = list(predictions_collection.find({}, {"_id": 0}))
-    return {"records": records}
+async def get_records(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    label: Optional[str] = Query(None),
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    max_confidence: Optional[float] = Query(None, ge=0, le=1),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    uploaded_by: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None),
+    user=Depends(get_required_user)
+):
+    """
+    سجل التنبؤات صفحة صفحة (الأحدث أولاً). next_cursor من الرد بينبعت كـ cursor
+    للصفحة اللي بعدها. fields = أسماء الحقول مفصولة بفاصلة (الافتراضي حقول القائمة الخفيفة).
+    الدكتور والأدمن بيشوفوا كل السجلات، وغيرهم بس الصور اللي رفعوها.
+    """
+    if user["role"] not in ("doctor", "admin"):
+        uploaded_by = user["id"]
+
+    query = build_history_query(
+        label=label, min_confidence=min_confidence, max_confidence=max_confidence,
+        date_from=date_from, date_to=date_to, uploaded_by=uploaded_by, cursor=cursor
+    )
+    records, next_cursor = await find_history(predictions_collection, query, parse_fields(fields), limit)
+    return {"records": jsonable_encoder(records), "next_cursor": next_cursor}
 
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, Form, Header, UploadFile, File
 from fastapi import HTTPException, Request
 from typing import Optional
+from core.uploads import IMAGE_KINDS, PROFILE_IMAGE_MAX_BYTES, stream_upload
 
 from pydantic import BaseModel, EmailStr
 from model.doctor_model import UpdateDoctorModel, LoginDoctorModel
@@ -79,7 +80,6 @@ async def update_profile(
     current_user=Depends(get_current_doctor)
 ):
     from Controller.doctor_controller import update_doctor
-    import os
 
     update_data = UpdateDoctorModel(
         first_name=first_name,
@@ -95,12 +95,11 @@ async def update_profile(
 
     # حفظ الصورة على السيرفر إذا تم رفعها
     if profile_image:
-        ext = profile_image.filename.split(".")[-1]
-        file_path = f"uploads/profile_images/{current_user['_id']}_profile.{ext}"
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, "wb") as f:
-            f.write(await profile_image.read())
-        update_data.profile_image_url = file_path  # حفظ مسار الصورة
+        upload = await stream_upload(
+            profile_image, IMAGE_KINDS, PROFILE_IMAGE_MAX_BYTES,
+            dest_path=f"uploads/profile_images/{current_user['_id']}_profile.{{ext}}"
+        )
+        update_data.profile_image_url = upload.path  # حفظ مسار الصورة
 
     # تحديث بيانات الدكتور
     doctor = await update_doctor(update_data, current_user)
@@ -13,7 +13,7 @@ async def upload_file(
     db: Session = Depends(get_db),
     user = Depends(get_current_patient)
 ):
-    return upload_to_local(file, user.id, db)
+    return await upload_to_local(file, user.id, db)
 
 # ---------------- رفع عدة ملفات ----------------
 @router.post("/upload_files/")
@@ -25,7 +25,7 @@ async def upload_files(
     urls = []
     for file in files:
         try:
-            urls.append(upload_to_local(file, user.id, db))
+            urls.append(await upload_to_local(file, user.id, db))
         except HTTPException as e:
             urls.append({"filename": file.filename, "error": e.detail})
     return {"files": urls}
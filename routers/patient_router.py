@@ -1,4 +1,5 @@
 from typing import Optional
+from core.uploads import IMAGE_KINDS, PROFILE_IMAGE_MAX_BYTES, stream_upload
 from Controller import patient_controller
 from fastapi import APIRouter, Depends, Header, Request ,Form,UploadFile, File
 from Controller.patient_controller import (
@@ -134,7 +135,6 @@ async def update_profile(
     current_user=Depends(get_current_patient)
 ):
     from Controller.doctor_controller import update_doctor
-    import os
 
     update_data = UpdatePatientRequest(
         first_name=first_name,
@@ -145,12 +145,11 @@ async def update_profile(
 
     # حفظ الصورة على السيرفر إذا تم رفعها
     if profile_image:
-        ext = profile_image.filename.split(".")[-1]
-        file_path = f"uploads/profile_images/{current_user['_id']}_profile.{ext}"
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, "wb") as f:
-            f.write(await profile_image.read())
-        update_data.profile_image_url = file_path  # حفظ مسار الصورة
+        upload = await stream_upload(
+            profile_image, IMAGE_KINDS, PROFILE_IMAGE_MAX_BYTES,
+            dest_path=f"uploads/profile_images/{current_user['_id']}_profile.{{ext}}"
+        )
+        update_data.profile_image_url = upload.path  # حفظ مسار الصورة
 
     patient =await update_patient(update_data, current_user)
 
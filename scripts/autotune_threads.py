@@ -0,0 +1,163 @@
+"""
+Autotuner لإعدادات الـ CPU تبع TensorFlow على الجهاز الحالي:
+بيجرّب intra-op × inter-op threads × oneDNN on/off × batch sizes على predict_and_explain
+(التنبؤ + Grad-CAM)، وبيحفظ أفضل إعداد بملف بروفايل بيطبّقه ModelManager وقت تحميل الموديل
+(core/ai_config.AI_THREAD_PROFILE + ai_controller.apply_thread_profile).
+
+كل تجربة بـ process جديد، لأن oneDNN والـ thread pools بينضبطوا مرة وحدة قبل أول عملية TensorFlow.
+--workers = عدد الـ processes اللي رح تشغّل الموديل على نفس الجهاز (uvicorn workers، أو 1 مع
+سيرفر الـ inference)، والـ intra-op threads لكل واحد ما بتعدّي cores / workers عشان ما يتزاحموا.
+
+    python scripts/autotune_threads.py --workers 2
+    python scripts/autotune_threads.py --batch-sizes 1,4,8 --max-latency-ms 1500 --output ai_thread_profile.json
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def thread_candidates(cores):
+    # قوى الـ 2 لحد عدد الـ cores، والعدد نفسه
+    candidates = {cores}
+    n = 1
+    while n < cores:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+
+# ---------------- تجربة وحدة (process منفصل) ----------------
+def run_trial(args):
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(args.intra)
+    tf.config.threading.set_inter_op_parallelism_threads(args.inter)
+
+    from tensorflow.keras.models import load_model
+    from Controller import ai_controller as ai
+    from benchmark_ai import batches, percentiles
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")) + glob.glob(os.path.join(args.images, "*.png")))
+    xs = []
+    for path in paths:
+        with open(path, "rb") as f:
+            xs.append(ai.decode_image_bytes(f.read())[1])
+
+    model = load_model(args.model)
+    rows = []
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        ai.predict_and_explain_batch(model, next(batches(xs, batch_size, 1)))  # compile للـ batch size هاد
+        times = []
+        for batch in batches(xs, batch_size, args.iterations):
+            start = time.perf_counter()
+            ai.predict_and_explain_batch(model, batch)
+            times.append(1000 * (time.perf_counter() - start))
+        row = percentiles(times)
+        row["batch_size"] = batch_size
+        row["images_per_sec"] = round(batch_size * len(times) / (sum(times) / 1000), 2)
+        rows.append(row)
+
+    print(json.dumps({"results": rows}))
+
+
+def trial(args, intra, inter, onednn):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--trial",
+        "--intra", str(intra), "--inter", str(inter),
+        "--model", args.model, "--images", args.images,
+        "--batch-sizes", args.batch_sizes, "--iterations", str(args.iterations)
+    ]
+    env = dict(os.environ, TF_ENABLE_ONEDNN_OPTS="1" if onednn else "0", TF_CPP_MIN_LOG_LEVEL="2",
+               AI_MAX_BATCH_SIZE=str(max(int(size) for size in args.batch_sizes.split(","))))
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def best_configuration(trials, max_latency_ms):
+    # أعلى images/sec، بشرط p95 للدفعة تحت max_latency_ms إذا محدد
+    best = None
+    for entry in trials:
+        for row in entry.get("results", []):
+            if max_latency_ms is not None and row["p95_ms"] > max_latency_ms:
+                continue
+            if best is None or row["images_per_sec"] > best[1]["images_per_sec"]:
+                best = (entry, row)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Autotune TensorFlow CPU threading for AI inference")
+    parser.add_argument("--model", default=os.getenv("AI_MODEL_PATH", "efficientnetv2l_mammography_3class.h5"))
+    parser.add_argument("--images", default=os.path.join("uploads", "image_Ai"))
+    parser.add_argument("--workers", type=int, default=1, help="Model processes sharing this machine")
+    parser.add_argument("--intra", default=None, help="intra-op thread counts to try (default: powers of two)")
+    parser.add_argument("--inter", default="1,2", help="inter-op thread counts to try")
+    parser.add_argument("--onednn", default="1,0", help="oneDNN settings to try (1=on, 0=off)")
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--max-latency-ms", type=float, default=None, help="Upper bound on batch p95 latency")
+    parser.add_argument("--output", default=os.getenv("AI_THREAD_PROFILE", "ai_thread_profile.json"))
+    parser.add_argument("--trial", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trial:
+        args.intra, args.inter = int(args.intra), int(args.inter)
+        return run_trial(args)
+
+    cores = max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    intra_values = [int(v) for v in args.intra.split(",")] if args.intra else thread_candidates(cores)
+    inter_values = [int(v) for v in args.inter.split(",")]
+    onednn_values = [v.strip() == "1" for v in args.onednn.split(",")]
+
+    print(f"{os.cpu_count()} cores, {args.workers} worker(s) -> up to {cores} intra-op threads each")
+    print(f"{'onednn':>7}{'intra':>7}{'inter':>7}{'batch':>7}{'p50 ms':>10}{'p95 ms':>10}{'img/s':>9}")
+
+    trials = []
+    for onednn, intra, inter in itertools.product(onednn_values, intra_values, inter_values):
+        entry = {"onednn": onednn, "intra_op_threads": intra, "inter_op_threads": inter}
+        entry.update(trial(args, intra, inter, onednn))
+        trials.append(entry)
+        if "error" in entry:
+            print(f"{int(onednn):>7}{intra:>7}{inter:>7}  failed: {entry['error']}")
+            continue
+        for row in entry["results"]:
+            print(f"{int(onednn):>7}{intra:>7}{inter:>7}{row['batch_size']:>7}"
+                  f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['images_per_sec']:>9.2f}")
+
+    best = best_configuration(trials, args.max_latency_ms)
+    if best is None:
+        sys.exit("No configuration met the constraints")
+    entry, row = best
+
+    profile = {
+        "created_at": datetime.utcnow().isoformat(),
+        "machine": {"platform": platform.platform(), "cpu_count": os.cpu_count(), "workers": args.workers},
+        "model": args.model,
+        "onednn": entry["onednn"],
+        "intra_op_threads": entry["intra_op_threads"],
+        "inter_op_threads": entry["inter_op_threads"],
+        "batch_size": row["batch_size"],
+        "images_per_sec": row["images_per_sec"],
+        "p95_ms": row["p95_ms"],
+        "trials": trials
+    }
+    with open(args.output, "w") as f:
+        json.dump(profile, f, indent=2)
+
+    print(f"\nBest: oneDNN={'on' if entry['onednn'] else 'off'}, intra={entry['intra_op_threads']}, "
+          f"inter={entry['inter_op_threads']}, batch={row['batch_size']} -> {row['images_per_sec']} img/s")
+    print(f"Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmark كامل لمسار الـ AI على مجموعة صور ثابتة:
+- latency (p50/p95/p99) و images/sec لكل batch size، مع وبدون Grad-CAM
+- توزيع الزمن على المراحل: decode, resize/preprocess, forward, gradient, overlay, png
+النتيجة بتنكتب JSON عشان نقارن بين موديلات / backends / إعدادات threads.
+
+    python scripts/benchmark_ai.py --batch-sizes 1,2,4,8 --iterations 20 --output bench.json
+    python scripts/benchmark_ai.py --backend tflite --tflite model_int8.tflite --threads 4
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+
+def percentiles(times_ms):
+    return {
+        "p50_ms": round(float(np.percentile(times_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(times_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(times_ms, 99)), 2),
+        "mean_ms": round(statistics.mean(times_ms), 2)
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, 1000 * (time.perf_counter() - start)
+
+
+def batches(items, batch_size, iterations):
+    # نفس ترتيب الصور كل مرة عشان النتائج تكون قابلة للمقارنة
+    for i in range(iterations):
+        start = (i * batch_size) % len(items)
+        yield [items[(start + j) % len(items)] for j in range(batch_size)]
+
+
+def bench_end_to_end(ai, model, classifier, datas, batch_size, iterations, explain):
+    # من الـ bytes للرد: decode + inference (+ رسم وترميز PNG لو explain)
+    def run(batch):
+        decoded = [ai.decode_image_bytes(data) for data in batch]
+        results = ai.predict_and_explain_batch(model, [x for _, x in decoded], classifier=classifier, explain=explain)
+        if explain:
+            for (orig, _), result in zip(decoded, results):
+                ai.render_explanation(orig, result["heatmap_grid"], "png")
+
+    run(next(batches(datas, batch_size, 1)))  # compile للـ batch size هاد
+    times = [timed(run, batch)[1] for batch in batches(datas, batch_size, iterations)]
+
+    row = percentiles(times)
+    row["images_per_sec"] = round(batch_size * len(times) / (sum(times) / 1000), 2)
+    return row
+
+
+def bench_stages(ai, model, classifier, datas, batch_size, iterations):
+    # كل مرحلة لحالها؛ forward و gradient محسوبين للدفعة ومقسومين على عدد الصور
+    explainer = ai.get_explainer(model)
+    stages = {name: [] for name in ("decode", "resize_preprocess", "forward", "gradient", "overlay", "png_encode")}
+
+    def forward(x):
+        return classifier.predict(x) if classifier is not None else explainer.predict(x)
+
+    warm = next(batches(datas, batch_size, 1))
+    x = np.concatenate([ai.decode_image_bytes(data)[1] for data in warm], axis=0)
+    explainer(x, np.argmax(forward(x), axis=1).astype(np.int32))
+
+    for batch in batches(datas, batch_size, iterations):
+        origs, xs = [], []
+        for data in batch:
+            img, ms = timed(ai.decode_rgb, data)
+            stages["decode"].append(ms)
+            (orig, x), ms = timed(ai.preprocess_rgb, img)
+            stages["resize_preprocess"].append(ms)
+            origs.append(orig)
+            xs.append(x)
+
+        x = np.concatenate(xs, axis=0)
+        probs, forward_ms = timed(forward, x)
+        class_indices = np.argmax(probs, axis=1).astype(np.int32)
+        # مسار heatmaps بيعيد الـ forward جوّا الـ tape، فالـ gradient = الفرق
+        heatmaps, heatmaps_ms = timed(explainer, x, class_indices)
+        stages["forward"].append(forward_ms / batch_size)
+        stages["gradient"].append(max(0.0, heatmaps_ms - forward_ms) / batch_size)
+
+        for orig, heatmap in zip(origs, heatmaps):
+            (heatmap_img, overlay), ms = timed(ai.overlay_heatmap_and_box, orig, heatmap)
+            stages["overlay"].append(ms)
+            _, ms = timed(lambda: (ai.encode_image(overlay, "png"), ai.encode_image(heatmap_img, "png")))
+            stages["png_encode"].append(ms)
+
+    total = sum(statistics.mean(times) for times in stages.values())
+    return {
+        name: {
+            "mean_ms_per_image": round(statistics.mean(times), 2),
+            "share": round(statistics.mean(times) / total, 3)
+        }
+        for name, times in stages.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI inference benchmark suite")
+    parser.add_argument("--model", default="efficientnetv2l_mammography_3class.h5")
+    parser.add_argument("--images", default=os.path.join("uploads", "image_Ai"))
+    parser.add_argument("--backend", default="keras", choices=["keras", "tflite"])
+    parser.add_argument("--tflite", default=None, help="TFLite model path (backend=tflite)")
+    parser.add_argument("--threads", type=int, default=None, help="TFLite interpreter threads")
+    parser.add_argument("--intra-op-threads", type=int, default=None)
+    parser.add_argument("--inter-op-threads", type=int, default=None)
+    parser.add_argument("--batch-sizes", default="1,2,4,8")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--output", default=None, help="JSON output path (default: print only)")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")) + glob.glob(os.path.join(args.images, "*.png")))
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+    datas = []
+    for path in paths:
+        with open(path, "rb") as f:
+            datas.append(f.read())
+
+    # إعدادات الـ threads لازم تنضبط قبل أول عملية TensorFlow
+    import tensorflow as tf
+    if args.intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(args.intra_op_threads)
+    if args.inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(args.inter_op_threads)
+
+    from tensorflow.keras.models import load_model
+    from Controller import ai_controller as ai
+
+    model = load_model(args.model)
+    classifier = ai.load_classifier(args.backend, args.tflite, num_threads=args.threads)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",") if size.strip()]
+
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "config": {
+            "model": args.model,
+            "backend": args.backend,
+            "tflite": args.tflite if args.backend == "tflite" else None,
+            "tflite_threads": args.threads,
+            "intra_op_threads": tf.config.threading.get_intra_op_parallelism_threads(),
+            "inter_op_threads": tf.config.threading.get_inter_op_parallelism_threads(),
+            "jit_compile": ai.AI_JIT_COMPILE,
+            "images": len(datas),
+            "iterations": args.iterations
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "tensorflow": tf.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "end_to_end": [],
+        "stages": {}
+    }
+
+    print(f"{'batch':>6}{'explain':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'img/s':>9}")
+    for batch_size in batch_sizes:
+        for explain in (False, True):
+            row = bench_end_to_end(ai, model, classifier, datas, batch_size, args.iterations, explain)
+            report["end_to_end"].append(dict(batch_size=batch_size, explain=explain, **row))
+            print(f"{batch_size:>6}{str(explain):>9}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+                  f"{row['p99_ms']:>10.2f}{row['images_per_sec']:>9.2f}")
+
+    for batch_size in batch_sizes:
+        stages = bench_stages(ai, model, classifier, datas, batch_size, args.iterations)
+        report["stages"][str(batch_size)] = stages
+        print(f"\nstages (batch={batch_size}, ms per image)")
+        for name, row in stages.items():
+            print(f"  {name:<20}{row['mean_ms_per_image']:>10.2f}{100 * row['share']:>8.1f}%")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+يقارن زمن رسم وترميز صور الشرح (overlay + heatmap) وحجم الرد لكل صيغة:
+PNG base64 القديم مقابل explain=none و JPEG/WebP بجودات مختلفة و multipart.
+
+    python scripts/benchmark_explain_formats.py
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tensorflow.keras.models import load_model
+
+from Controller.ai_controller import load_inputs, predict_and_explain_batch, render_explanation
+
+
+VARIANTS = [
+    ("png base64 (before)", "inline", "png", None),
+    ("none", "none", None, None),
+    ("jpeg q85 base64", "inline", "jpeg", 85),
+    ("jpeg q70 base64", "inline", "jpeg", 70),
+    ("webp q80 base64", "inline", "webp", 80),
+    ("webp q60 base64", "inline", "webp", 60),
+    ("png multipart", "multipart", "png", None),
+    ("webp q80 multipart", "multipart", "webp", 80),
+]
+
+
+def payload_size(result, explain, rendered):
+    payload = {"pred_label": result["pred_label"], "probs": result["probs"], "last_conv": result["last_conv"]}
+    body = json.dumps(payload).encode("utf-8")
+    if explain == "inline":
+        payload["overlay"] = base64.b64encode(rendered["overlay"]).decode("utf-8")
+        payload["heatmap"] = base64.b64encode(rendered["heatmap"]).decode("utf-8")
+        body = json.dumps(payload).encode("utf-8")
+    elif explain == "multipart":
+        body += rendered["overlay"] + rendered["heatmap"] + b"x" * 300  # headers/boundaries تقريباً
+    return len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Explanation payload format benchmark")
+    parser.add_argument("--model", default="efficientnetv2l_mammography_3class.h5")
+    parser.add_argument("--images", default=os.path.join("uploads", "image_Ai"))
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")) + glob.glob(os.path.join(args.images, "*.png")))
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+
+    model = load_model(args.model)
+    samples = []
+    for path in paths:
+        orig, x = load_inputs(path)
+        samples.append((orig, predict_and_explain_batch(model, [x])[0]))
+
+    print(f"{'variant':<22}{'encode ms':>12}{'payload KB':>13}")
+    for name, explain, image_format, quality in VARIANTS:
+        times, sizes = [], []
+        for orig, result in samples:
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                rendered = None
+                if explain != "none":
+                    rendered = render_explanation(orig, result["heatmap_grid"], image_format, quality)
+                    if explain == "inline":
+                        base64.b64encode(rendered["overlay"])
+                        base64.b64encode(rendered["heatmap"])
+                times.append(1000 * (time.perf_counter() - start))
+            sizes.append(payload_size(result, explain, rendered))
+        print(f"{name:<22}{statistics.median(times):>12.2f}{statistics.mean(sizes) / 1024:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+يقيس زمن الطلب الواحد (batch=1) على الـ CPU:
+model.predict القديم مقابل الـ signatures الثابتة بدون XLA ومع XLA.
+
+    python scripts/benchmark_xla.py --requests 50
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from tensorflow.keras.models import load_model
+
+from Controller.ai_controller import GradCamExplainer, load_inputs
+
+
+def measure(fn, xs, requests):
+    fn(xs[0])  # أول استدعاء فيه الـ trace/compile
+    times = []
+    for i in range(requests):
+        start = time.perf_counter()
+        fn(xs[i % len(xs)])
+        times.append(1000 * (time.perf_counter() - start))
+    return {
+        "p50_ms": round(statistics.median(times), 2),
+        "p95_ms": round(float(np.percentile(times, 95)), 2),
+        "mean_ms": round(statistics.mean(times), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XLA inference signature benchmark")
+    parser.add_argument("--model", default="efficientnetv2l_mammography_3class.h5")
+    parser.add_argument("--images", default=os.path.join("uploads", "image_Ai"))
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")) + glob.glob(os.path.join(args.images, "*.png")))
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+
+    model = load_model(args.model)
+    xs = [load_inputs(p)[1] for p in paths]
+
+    plain = GradCamExplainer(model, buckets=[1], jit_compile=False)
+    xla = GradCamExplainer(model, buckets=[1], jit_compile=True)
+
+    rows = {
+        "model.predict": measure(lambda x: model.predict({"input_layer_1": x}, verbose=0), xs, args.requests),
+        "predict (signature)": measure(plain.predict, xs, args.requests),
+        "predict (signature + XLA)": measure(xla.predict, xs, args.requests),
+        "predict+explain (signature)": measure(plain.predict_and_explain, xs, args.requests),
+        "predict+explain (signature + XLA)": measure(xla.predict_and_explain, xs, args.requests),
+    }
+
+    baseline = rows["model.predict"]["p50_ms"]
+    print(f"{'path':<36}{'p50 ms':>10}{'p95 ms':>10}{'vs predict':>12}")
+    for name, row in rows.items():
+        print(f"{name:<36}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{baseline / row['p50_ms']:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
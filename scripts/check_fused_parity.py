@@ -0,0 +1,98 @@
+"""
+يقارن المسار المدمج (forward واحد + backward) بالمسار القديم
+(model.predict ثم gradcam بتمريرة ثانية) على صور العينة.
+المرجع نسخة مجمّدة من التنفيذ الأصلي قبل GradCamExplainer، فما بنقارن الكود الجديد بحاله.
+
+    python scripts/check_fused_parity.py
+"""
+import argparse
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import Model, load_model
+
+from Controller.ai_controller import get_explainer, load_preprocessed
+
+
+# ---------------- المرجع: التنفيذ الأصلي كما كان (لا تعدّله) ----------------
+def reference_find_last_conv_layer(model):
+    for layer in reversed(model.layers):
+        if isinstance(layer, (tf.keras.layers.Conv2D,
+                              tf.keras.layers.DepthwiseConv2D)):
+            return layer.name
+        if isinstance(layer, tf.keras.Model):
+            name = reference_find_last_conv_layer(layer)
+            if name:
+                return name
+    return None
+
+
+def reference_gradcam(model, x, class_index):
+    # grad_model جديد لكل طلب، والـ tape حوالين تمريرة كاملة
+    last_conv_layer = model.get_layer(reference_find_last_conv_layer(model))
+    grad_model = Model(inputs=model.inputs, outputs=[last_conv_layer.output, model.output])
+
+    with tf.GradientTape() as tape:
+        conv_outputs, predictions = grad_model({"input_layer_1": x})
+        if isinstance(predictions, list):
+            predictions = predictions[0]
+        loss = predictions[0, class_index]
+
+    grads = tape.gradient(loss, conv_outputs)
+    pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
+    heatmap = tf.reduce_sum(conv_outputs[0] * pooled_grads, axis=-1)
+    heatmap = tf.maximum(heatmap, 0)
+    heatmap /= tf.reduce_max(heatmap) + 1e-8
+    return heatmap.numpy()
+
+
+def two_pass(model, x):
+    probs = model.predict({"input_layer_1": x}, verbose=0)[0]
+    heatmap = reference_gradcam(model, x, int(np.argmax(probs)))
+    return probs, heatmap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fused vs two-pass Grad-CAM parity")
+    parser.add_argument("--model", default="efficientnetv2l_mammography_3class.h5")
+    parser.add_argument("--images", default=os.path.join("uploads", "image_Ai"))
+    parser.add_argument("--prob-atol", type=float, default=1e-4)
+    parser.add_argument("--heatmap-atol", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")) + glob.glob(os.path.join(args.images, "*.png")))
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+
+    model = load_model(args.model)
+    explainer = get_explainer(model)
+
+    failures = 0
+    for path in paths:
+        x = load_preprocessed(path)
+        ref_probs, ref_heatmap = two_pass(model, x)
+        probs, heatmaps = explainer.predict_and_explain(x)
+
+        prob_diff = float(np.abs(probs[0] - ref_probs).max())
+        heatmap_diff = float(np.abs(heatmaps[0] - ref_heatmap).max())
+        same_label = int(np.argmax(probs[0])) == int(np.argmax(ref_probs))
+
+        ok = same_label and prob_diff <= args.prob_atol and heatmap_diff <= args.heatmap_atol
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {os.path.basename(path)}: "
+              f"label={'same' if same_label else 'DIFFERENT'} "
+              f"max|dprob|={prob_diff:.2e} max|dheatmap|={heatmap_diff:.2e}")
+
+    if failures:
+        print(f"{failures}/{len(paths)} images differ")
+        sys.exit(1)
+    print(f"All {len(paths)} images match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+تحويل موديل الماموجرام (.h5) إلى TFLite مكمّم للـ CPU:
+  - dynamic-range: أوزان int8 والحسابات float
+  - int8: أوزان و activations int8، والـ calibration من صور uploads/image_Ai
+
+بعد التحويل بيطبع تقرير (ويحفظه JSON) فيه فرق الدقة والسرعة مقارنة بالـ .h5.
+
+    python scripts/convert_tflite.py --mode both
+    python scripts/convert_tflite.py --mode int8 --labels labels.csv   # filename,label
+
+بعدها:  AI_BACKEND=tflite AI_TFLITE_PATH=<path> uvicorn main:app
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+from Controller.ai_controller import CLASS_NAMES, TFLiteClassifier, decode_image_bytes
+
+
+def list_images(folder):
+    return sorted(
+        p for ext in ("*.jpg", "*.jpeg", "*.png")
+        for p in glob.glob(os.path.join(folder, ext))
+    )
+
+
+def load_batch(paths):
+    xs = []
+    for path in paths:
+        with open(path, "rb") as f:
+            xs.append(decode_image_bytes(f.read())[1])
+    return xs
+
+
+def convert(model, mode, calibration):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if mode == "int8":
+        def representative_dataset():
+            for x in calibration:
+                yield [x]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    return converter.convert()
+
+
+def time_per_image(predict, xs, repeats):
+    predict(xs[0])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for x in xs:
+            predict(x)
+    return 1000 * (time.perf_counter() - start) / (repeats * len(xs))
+
+
+def read_labels(path):
+    with open(path, newline="") as f:
+        return {row[0]: row[1] for row in csv.reader(f) if len(row) >= 2}
+
+
+def accuracy(probs, names, labels):
+    known = [(p, labels[n]) for p, n in zip(probs, names) if n in labels]
+    if not known:
+        return None
+    return sum(CLASS_NAMES[int(np.argmax(p))] == label for p, label in known) / len(known)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the mammography model to quantized TFLite")
+    parser.add_argument("--model", default="efficientnetv2l_mammography_3class.h5")
+    parser.add_argument("--images", default=os.path.join("uploads", "image_Ai"))
+    parser.add_argument("--mode", choices=["dynamic", "int8", "both"], default="both")
+    parser.add_argument("--calibration-size", type=int, default=100)
+    parser.add_argument("--labels", help="CSV: filename,label لحساب الدقة الفعلية")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--report", default="tflite_report.json")
+    args = parser.parse_args()
+
+    paths = list_images(args.images)
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+
+    model = load_model(args.model)
+    xs = load_batch(paths)
+    names = [os.path.basename(p) for p in paths]
+    labels = read_labels(args.labels) if args.labels else {}
+
+    ref_probs = [model.predict({"input_layer_1": x}, verbose=0)[0] for x in xs]
+    ref_ms = time_per_image(lambda x: model.predict({"input_layer_1": x}, verbose=0), xs, args.repeats)
+
+    report = {
+        "model": args.model,
+        "images": len(xs),
+        "keras": {
+            "ms_per_image": round(ref_ms, 2),
+            "size_mb": round(os.path.getsize(args.model) / 2 ** 20, 1),
+            "accuracy": accuracy(ref_probs, names, labels)
+        }
+    }
+
+    modes = ["dynamic", "int8"] if args.mode == "both" else [args.mode]
+    stem = os.path.splitext(args.model)[0]
+    for mode in modes:
+        out_path = f"{stem}_{mode}.tflite"
+        with open(out_path, "wb") as f:
+            f.write(convert(model, mode, xs[:args.calibration_size]))
+
+        classifier = TFLiteClassifier(out_path, num_threads=args.threads)
+        probs = [classifier.predict(x)[0] for x in xs]
+        ms = time_per_image(classifier.predict, xs, args.repeats)
+
+        diffs = np.abs(np.array(probs) - np.array(ref_probs))
+        report[mode] = {
+            "path": out_path,
+            "size_mb": round(os.path.getsize(out_path) / 2 ** 20, 1),
+            "ms_per_image": round(ms, 2),
+            "speedup": round(ref_ms / ms, 2),
+            "top1_agreement": float(np.mean(np.argmax(probs, axis=1) == np.argmax(ref_probs, axis=1))),
+            "max_prob_diff": float(diffs.max()),
+            "mean_prob_diff": float(diffs.mean()),
+            "accuracy": accuracy(probs, names, labels)
+        }
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+تقييم فلتر الصور الغريبة (Controller/ood_filter.py) على مجموعتين من الصور:
+- mammograms: صور ماموجرام حقيقية، أي رفض هون = false reject
+- others: سيلفي / مستندات / screenshots، المطلوب ينرفضوا
+بيطبع نسبة الرفض، الـ false-reject rate، عدد كل سبب، وزمن الفلتر لكل صورة
+(واختيارياً زمن الموديل الكامل للمقارنة). العتبات بتنقرأ من نفس متغيرات AI_OOD_*.
+
+    python scripts/evaluate_ood_filter.py --mammograms uploads/image_Ai --others samples/junk
+    python scripts/evaluate_ood_filter.py --mammograms data/mammo --others data/junk --with-model --output ood.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from core import ai_config
+
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.webp")
+
+
+def image_paths(directory):
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+    return sorted(paths)
+
+
+def latency(times_ms):
+    if not times_ms:
+        return None
+    return {
+        "p50_ms": round(float(np.percentile(times_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(times_ms, 95)), 2),
+        "mean_ms": round(float(np.mean(times_ms)), 2)
+    }
+
+
+def screen_set(paths):
+    from Controller.ood_filter import screen_image
+
+    rows, times = [], []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        start = time.perf_counter()
+        reasons, stats = screen_image(data)
+        times.append(1000 * (time.perf_counter() - start))
+        rows.append({"path": path, "reasons": reasons, "stats": stats})
+    return rows, times
+
+
+def summarize(rows):
+    rejected = [row for row in rows if row["reasons"]]
+    return {
+        "images": len(rows),
+        "rejected": len(rejected),
+        "rejection_rate": round(len(rejected) / len(rows), 4) if rows else None,
+        "reasons": dict(Counter(reason for row in rejected for reason in row["reasons"]))
+    }
+
+
+def model_times(paths, model_path, limit):
+    # زمن المسار الكامل (decode + forward + Grad-CAM) اللي الفلتر بيوفّره على الصور المرفوضة
+    from tensorflow.keras.models import load_model
+    from Controller import ai_controller as ai
+
+    model = load_model(model_path)
+    paths = paths[:limit]
+    ai.predict_and_explain_batch(model, [ai.load_inputs(paths[0])[1]])
+
+    times = []
+    for path in paths:
+        start = time.perf_counter()
+        ai.predict_and_explain_batch(model, [ai.load_inputs(path)[1]])
+        times.append(1000 * (time.perf_counter() - start))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the out-of-distribution pre-filter")
+    parser.add_argument("--mammograms", required=True, help="Directory of real mammograms")
+    parser.add_argument("--others", required=True, help="Directory of non-mammogram uploads")
+    parser.add_argument("--with-model", action="store_true", help="Also time the full model for comparison")
+    parser.add_argument("--model", default=ai_config.MODEL_PATH)
+    parser.add_argument("--model-images", type=int, default=10, help="Images timed with the full model")
+    parser.add_argument("--output", default=None, help="JSON output path (default: print only)")
+    args = parser.parse_args()
+
+    mammogram_paths = image_paths(args.mammograms)
+    other_paths = image_paths(args.others)
+    if not mammogram_paths or not other_paths:
+        sys.exit("Both --mammograms and --others need at least one image")
+
+    mammograms, mammogram_ms = screen_set(mammogram_paths)
+    others, other_ms = screen_set(other_paths)
+
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "thresholds": {
+            "max_colorfulness": ai_config.AI_OOD_MAX_COLORFULNESS,
+            "max_bright_fraction": ai_config.AI_OOD_MAX_BRIGHT_FRACTION,
+            "min_dark_fraction": ai_config.AI_OOD_MIN_DARK_FRACTION,
+            "max_aspect": ai_config.AI_OOD_MAX_ASPECT,
+            "min_side": ai_config.AI_OOD_MIN_SIDE
+        },
+        "mammograms": summarize(mammograms),
+        "others": summarize(others),
+        "filter_latency": latency(mammogram_ms + other_ms),
+        "false_rejects": [row for row in mammograms if row["reasons"]],
+        "missed": [row for row in others if not row["reasons"]]
+    }
+    report["false_reject_rate"] = report["mammograms"]["rejection_rate"]
+    report["rejection_rate"] = report["others"]["rejection_rate"]
+
+    print(f"non-mammograms rejected : {report['others']['rejected']}/{len(others)}"
+          f" ({100 * report['rejection_rate']:.1f}%)")
+    print(f"mammograms rejected     : {report['mammograms']['rejected']}/{len(mammograms)}"
+          f" ({100 * report['false_reject_rate']:.1f}% false rejects)")
+    print(f"reasons (others)        : {report['others']['reasons']}")
+    print(f"filter latency          : {report['filter_latency']}")
+    for row in report["false_rejects"]:
+        print(f"  false reject {row['path']}: {row['reasons']} {row['stats']}")
+    for row in report["missed"]:
+        print(f"  missed       {row['path']}: {row['stats']}")
+
+    if args.with_model:
+        report["model_latency"] = latency(model_times(mammogram_paths, args.model, args.model_images))
+        print(f"full model latency      : {report['model_latency']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
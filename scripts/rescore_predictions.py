@@ -0,0 +1,213 @@
+"""
+إعادة تقييم كل صور الماموجرام المحفوظة بعد تحديث الموديل، وتحديث predictions_collection:
+- الملفات بتنقرأ وبتنفك بـ pool من الـ threads وبتتجهز دفعات قدّام (prefetch)
+  والموديل شغال على دفعات كبيرة بنفس الوقت
+- كل دفعة بتنكتب بـ bulk_write وحدة (كل السجلات بنفس الـ sha256 للصورة، عليه index).
+  المطابقة بالـ sha256 بس: مسار الصورة القديم كان اسم ملف العميل وممكن ينكتب فوقه بصورة تانية،
+  فالسجلات القديمة اللي ما إلها image_sha256 ما بتتلمس (العدد بينطبع بالبداية)
+- checkpoint بعد كل دفعة (آخر ملف بالترتيب)، فالتشغيل بيكمّل من مكان ما وقف
+- images/sec بينطبع أثناء الشغل وبالآخر
+
+    python scripts/rescore_predictions.py --model models/v2.h5 --version v2
+    python scripts/rescore_predictions.py --model models/v2.h5 --version v2 --no-explain --batch-size 32
+    python scripts/rescore_predictions.py ... --reset     # من الأول بتجاهل الـ checkpoint
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.webp")
+
+
+def image_paths(directory):
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(directory, pattern)))
+    return sorted(paths)
+
+
+# ---------------- checkpoint ----------------
+def load_checkpoint(path, version):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    # checkpoint لنسخة موديل تانية ما بينفع نكمّل منه
+    return checkpoint if checkpoint.get("model_version") == version else None
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# ---------------- decode (threads) ----------------
+def decode_file(path):
+    from Controller.image_ops import decode_image_bytes
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        _, x = decode_image_bytes(data)
+    except Exception as e:
+        return {"path": path, "error": str(e)}
+    return {"path": path, "sha256": hashlib.sha256(data).hexdigest(), "x": x}
+
+
+def prefetched_batches(pool, paths, batch_size, prefetch):
+    # أول prefetch دفعات بتنبعت للـ pool، وكل ما تطلع دفعة بتنبعت اللي بعدها
+    chunks = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    pending = []
+    for chunk in chunks[:prefetch]:
+        pending.append([pool.submit(decode_file, path) for path in chunk])
+    next_chunk = prefetch
+
+    while pending:
+        futures = pending.pop(0)
+        if next_chunk < len(chunks):
+            pending.append([pool.submit(decode_file, path) for path in chunks[next_chunk]])
+            next_chunk += 1
+        yield [future.result() for future in futures]
+
+
+# ---------------- التحديثات ----------------
+def build_updates(decoded, results, version, explain):
+    from pymongo import UpdateMany
+
+    from Controller.image_ops import find_regions
+    from Controller.prediction_cache import pack_heatmap_grid
+    from Controller.similarity_index import pack_embedding
+
+    now = datetime.utcnow()
+    updates = []
+    for item, result in zip(decoded, results):
+        fields = {
+            "model_version": version,
+            "prediction": result["pred_label"],
+            "confidence": max(result["probs"]),
+            "probabilities": result["probs"],
+            "last_conv_layer": result["last_conv"],
+            "rescored_at": now
+        }
+        if result.get("embedding") is not None:
+            fields["embedding"] = pack_embedding(result["embedding"])
+
+        # الشرح القديم تبع الموديل القديم، فإما بينحسب من جديد أو بينشال
+        unset = {"tta_views": "", "shadow": "", "explanation_error": ""}
+        if explain:
+            fields["explanation"] = pack_heatmap_grid(result["heatmap_grid"])
+            fields["regions"] = find_regions(result["heatmap_grid"])
+            fields["explanation_status"] = "ready"
+        else:
+            fields["explanation_status"] = "missing"
+            unset.update({"explanation": "", "regions": ""})
+
+        updates.append(UpdateMany({"image_sha256": item["sha256"]}, {"$set": fields, "$unset": unset}))
+    return updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored mammograms with a new model version")
+    parser.add_argument("--model", required=True, help="Keras .h5 model path")
+    parser.add_argument("--version", required=True, help="model_version written to the records")
+    parser.add_argument("--images", default=os.path.join("uploads", "image_Ai"))
+    parser.add_argument("--backend", default="keras", choices=["keras", "tflite"])
+    parser.add_argument("--tflite", default=None, help="TFLite model path (backend=tflite)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per model call and per bulk_write")
+    parser.add_argument("--decode-workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--prefetch", type=int, default=2, help="Batches decoded ahead of the model")
+    parser.add_argument("--no-explain", action="store_true", help="Skip Grad-CAM and drop stale explanations")
+    parser.add_argument("--checkpoint", default=None, help="Default: <images>/.rescore_checkpoint.json")
+    parser.add_argument("--reset", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Run the model but do not write to MongoDB")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many images")
+    args = parser.parse_args()
+
+    paths = image_paths(args.images)
+    checkpoint_path = args.checkpoint or os.path.join(args.images, ".rescore_checkpoint.json")
+    checkpoint = None if args.reset else load_checkpoint(checkpoint_path, args.version)
+    if checkpoint:
+        paths = [path for path in paths if path > checkpoint["last_path"]]
+        print(f"Resuming after {checkpoint['last_path']} ({checkpoint['processed']} done)")
+    else:
+        checkpoint = {"model_version": args.version, "model_path": args.model, "processed": 0,
+                      "matched": 0, "errors": 0, "labels": {}, "last_path": "", "started_at": datetime.utcnow().isoformat()}
+    if args.limit is not None:
+        paths = paths[:args.limit]
+    if not paths:
+        sys.exit("Nothing to re-score")
+
+    # حجم الدفعة هو نفسه الـ signature الكبيرة تبع الـ explainer، ولازم ينضبط قبل الـ import
+    os.environ["AI_MAX_BATCH_SIZE"] = str(args.batch_size)
+    from tensorflow.keras.models import load_model
+    from Controller import ai_controller as ai
+
+    collection = None
+    if not args.dry_run:
+        from pymongo import MongoClient
+        from database import MONGO_URL
+        collection = MongoClient(MONGO_URL)["university_project"]["predictions"]
+        legacy = collection.count_documents({"image_sha256": {"$exists": False}})
+        if legacy:
+            print(f"{legacy} records have no image_sha256 and will not be updated")
+
+    model = load_model(args.model)
+    classifier = ai.load_classifier(args.backend, args.tflite)
+    explain = not args.no_explain
+    ai.warm_up(model, classifier=classifier)  # كل الـ buckets، فآخر دفعة الأصغر ما بتعمل compile
+
+    labels = Counter(checkpoint["labels"])
+    started = time.perf_counter()
+    done = 0
+    print(f"Re-scoring {len(paths)} images as {args.version} (batch {args.batch_size}, explain={explain})")
+
+    with ThreadPoolExecutor(max_workers=args.decode_workers) as pool:
+        for batch in prefetched_batches(pool, paths, args.batch_size, args.prefetch):
+            decoded = [item for item in batch if "error" not in item]
+            for item in batch:
+                if "error" in item:
+                    checkpoint["errors"] += 1
+                    print(f"  skipped {item['path']}: {item['error']}")
+
+            if decoded:
+                results = ai.predict_and_explain_batch(
+                    model, [item["x"] for item in decoded], classifier=classifier, explain=explain
+                )
+                labels.update(result["pred_label"] for result in results)
+                if collection is not None:
+                    written = collection.bulk_write(build_updates(decoded, results, args.version, explain), ordered=False)
+                    checkpoint["matched"] += written.matched_count
+
+            done += len(batch)
+            checkpoint["processed"] += len(batch)
+            checkpoint["last_path"] = batch[-1]["path"]
+            checkpoint["labels"] = dict(labels)
+            if not args.dry_run:
+                save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.perf_counter() - started
+            print(f"  {done}/{len(paths)} images, {done / elapsed:.2f} images/sec")
+
+    elapsed = time.perf_counter() - started
+    checkpoint["finished_at"] = datetime.utcnow().isoformat()
+    if not args.dry_run:
+        save_checkpoint(checkpoint_path, checkpoint)
+    print(f"\nDone: {done} images in {elapsed:.1f}s ({done / elapsed:.2f} images/sec)")
+    print(f"Records updated: {checkpoint['matched']}, unreadable files: {checkpoint['errors']}")
+    print(f"Labels: {dict(labels)}")
+
+
+if __name__ == "__main__":
+    main()
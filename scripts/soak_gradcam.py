@@ -0,0 +1,95 @@
+"""
+Soak test للـ Grad-CAM: يشغّل gradcam() مئات المرات على نفس الموديل
+ويتأكد إن الذاكرة (RSS) ثابتة وإن زمن الطلب ثابت: وسيط آخر 10 استدعاءات ما بيعدّي
+--max-latency-ratio × زمن أول استدعاء بعد الـ warm-up، وإلا التشغيل بيفشل.
+
+    python scripts/soak_gradcam.py --calls 300
+    python scripts/soak_gradcam.py --calls 300 --uncached   # السلوك القديم للمقارنة
+"""
+import argparse
+import glob
+import os
+import resource
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from tensorflow.keras.models import load_model
+
+from Controller.ai_controller import GradCamExplainer, gradcam, load_preprocessed
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # macOS/غيره: أعلى قيمة وصلها الـ process
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grad-CAM soak test")
+    parser.add_argument("--model", default="efficientnetv2l_mammography_3class.h5")
+    parser.add_argument("--images", default=os.path.join("uploads", "image_Ai"))
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=64.0)
+    parser.add_argument("--max-latency-ratio", type=float, default=1.5,
+                        help="أعلى نسبة مسموحة بين وسيط آخر 10 استدعاءات وأول استدعاء بعد الـ warm-up")
+    parser.add_argument("--uncached", action="store_true",
+                        help="يبني grad_model جديد بكل استدعاء (زي الكود القديم)")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")) + glob.glob(os.path.join(args.images, "*.png")))
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+
+    model = load_model(args.model)
+    inputs = [load_preprocessed(p) for p in paths]
+
+    latencies = []
+    rss = []
+    for i in range(args.calls):
+        x = inputs[i % len(inputs)]
+        start = time.perf_counter()
+        if args.uncached:
+            GradCamExplainer(model)(x, [0])
+        else:
+            gradcam(model, x, 0)
+        latencies.append(1000 * (time.perf_counter() - start))
+        rss.append(current_rss_mb())
+
+    warm = min(args.warmup, args.calls - 1)
+    rss_growth = rss[-1] - rss[warm]
+    steady = latencies[warm:]
+    baseline = latencies[warm]
+    tail = statistics.median(latencies[-10:])
+
+    print(f"calls:            {args.calls} ({'uncached' if args.uncached else 'cached'})")
+    print(f"first call:       {latencies[0]:.1f} ms")
+    print(f"steady p50 / p95: {statistics.median(steady):.1f} / {np.percentile(steady, 95):.1f} ms")
+    print(f"first 10 vs last 10 (median): {statistics.median(latencies[:10]):.1f} -> {statistics.median(latencies[-10:]):.1f} ms")
+    print(f"latency after warm-up: {baseline:.1f} ms, last 10 median: {tail:.1f} ms ({tail / baseline:.2f}x)")
+    print(f"RSS after warm-up: {rss[warm]:.1f} MB, at end: {rss[-1]:.1f} MB (growth {rss_growth:+.1f} MB)")
+
+    failed = False
+    if rss_growth > args.max_rss_growth_mb:
+        print(f"FAIL: RSS grew more than {args.max_rss_growth_mb} MB")
+        failed = True
+    if tail > args.max_latency_ratio * baseline:
+        print(f"FAIL: steady latency regressed more than {args.max_latency_ratio}x the first call after warm-up")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()